@@ -0,0 +1,144 @@
+import csv
+import math
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from distance_matrix import EARTH_RADIUS_KM, cross_distances
+
+# Bundled airport dataset (from the MIT licensed airportsdata project, see
+# data/airports.LICENSE) and the binary snapshot built from it
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+AIRPORTS_CSV = os.environ.get('AIRPORTS_CSV', os.path.join(DATA_DIR, 'airports.csv'))
+AIRPORTS_SNAPSHOT = os.path.splitext(AIRPORTS_CSV)[0] + '.npy'
+
+# Airports are bucketed into 1 degree cells, numbered like latest_weather.grid_cell
+CELL_COUNT = 180 * 360
+# First search radius of a nearest query, doubled until enough airports are found
+NEAREST_START_KM = 100
+
+# Fixed-width record per airport. Text is stored as UTF-8 bytes, rows are
+# sorted by cell so each cell is one contiguous slice.
+airport_dtype = np.dtype([
+    ('icao', 'S4'), ('iata', 'S3'), ('country', 'S2'),
+    ('latitude', 'f8'), ('longitude', 'f8'), ('cell', 'i4'),
+    ('name', 'S72'), ('city', 'S48'),
+])
+
+Airport = namedtuple('Airport', ['icao', 'iata', 'name', 'city', 'country', 'latitude', 'longitude'])
+
+_airports = None
+_codes = None
+_cell_starts = None
+_lock = threading.Lock()
+
+def grid_cells(latitudes, longitudes):
+    return ((np.floor(latitudes).astype(np.int64) + 90).clip(0, 179) * 360
+            + (np.floor(longitudes).astype(np.int64) + 180) % 360)
+
+# Function to parse the CSV dataset into a cell-sorted record array
+def build_snapshot(csv_path=AIRPORTS_CSV):
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    airports = np.zeros(len(rows), dtype=airport_dtype)
+    for field in ('icao', 'iata', 'country', 'name', 'city'):
+        size = airport_dtype[field].itemsize
+        airports[field] = [row[field].encode('utf-8')[:size] for row in rows]
+    airports['latitude'] = [float(row['latitude']) for row in rows]
+    airports['longitude'] = [float(row['longitude']) for row in rows]
+    airports['cell'] = grid_cells(airports['latitude'], airports['longitude'])
+    return airports[np.argsort(airports['cell'], kind='stable')]
+
+# Function to load the registry once per process. The snapshot is memory
+# mapped, and rebuilt from the CSV when it is missing or older than it.
+def load_registry():
+    global _airports, _codes, _cell_starts
+    with _lock:
+        if _airports is not None:
+            return _airports
+        stale = (not os.path.exists(AIRPORTS_SNAPSHOT)
+                 or os.path.getmtime(AIRPORTS_SNAPSHOT) < os.path.getmtime(AIRPORTS_CSV))
+        if stale:
+            airports = build_snapshot()
+            try:
+                np.save(AIRPORTS_SNAPSHOT, airports)
+            except OSError:
+                pass
+            else:
+                airports = np.load(AIRPORTS_SNAPSHOT, mmap_mode='r')
+        else:
+            airports = np.load(AIRPORTS_SNAPSHOT, mmap_mode='r')
+
+        # IATA codes are three letters and ICAO codes four, so one dict holds both
+        codes = {}
+        for row, code in enumerate(airports['icao'].tolist()):
+            if code:
+                codes.setdefault(code.decode(), row)
+        for row, code in enumerate(airports['iata'].tolist()):
+            if code:
+                codes.setdefault(code.decode(), row)
+        _cell_starts = np.searchsorted(airports['cell'], np.arange(CELL_COUNT + 1))
+        _codes = codes
+        _airports = airports
+        return _airports
+
+def _airport(row):
+    record = _airports[row]
+    return Airport(record['icao'].decode(), record['iata'].decode(), record['name'].decode(errors='ignore'),
+                   record['city'].decode(errors='ignore'), record['country'].decode(),
+                   float(record['latitude']), float(record['longitude']))
+
+# Function to look an airport up by IATA or ICAO code, or None if unknown
+def get_airport(code):
+    load_registry()
+    row = _codes.get(code.strip().upper()) if code else None
+    return None if row is None else _airport(row)
+
+# (latitude, longitude) of an airport by IATA or ICAO code, or None if unknown
+def get_airport_coordinates(code):
+    load_registry()
+    row = _codes.get(code.strip().upper()) if code else None
+    if row is None:
+        return None
+    return (float(_airports['latitude'][row]), float(_airports['longitude'][row]))
+
+def _rows_near(latitude, longitude, radius_km):
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south = max(math.floor(latitude - dlat), -90)
+    north = min(math.floor(latitude + dlat), 89)
+    cos_lat = math.cos(math.radians(min(abs(latitude) + dlat, 89.9)))
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    if dlon >= 180:
+        west, east = -180, 179
+    else:
+        west, east = math.floor(longitude - dlon), math.floor(longitude + dlon)
+    columns = (np.arange(west, east + 1) + 180) % 360
+    ranges = []
+    for row in range(south, north + 1):
+        cells = (row + 90) * 360 + columns
+        ranges.extend(zip(_cell_starts[cells].tolist(), _cell_starts[cells + 1].tolist()))
+    return np.concatenate([np.arange(start, stop) for start, stop in ranges if stop > start] or [np.zeros(0, dtype=np.int64)])
+
+# The k airports nearest to a point as (airport, distance_km) pairs, nearest
+# first. Only the grid cells around the point are searched, widening the
+# radius until the k-th nearest is known to be inside it. With iata_only,
+# airports without an IATA code are skipped.
+def nearest_airports(latitude, longitude, k=5, iata_only=False):
+    if k < 1:
+        return []
+    airports = load_registry()
+    radius = NEAREST_START_KM
+    while True:
+        rows = _rows_near(latitude, longitude, radius)
+        if iata_only:
+            rows = rows[airports['iata'][rows] != b'']
+        whole_world = radius >= math.pi * EARTH_RADIUS_KM
+        if len(rows) >= k or whole_world:
+            coords = np.column_stack([airports['latitude'][rows], airports['longitude'][rows]])
+            distances = cross_distances([(latitude, longitude)], coords)[0]
+            order = np.argsort(distances)[:k]
+            if whole_world or (len(order) and distances[order[-1]] <= radius):
+                return [(_airport(rows[i]), float(distances[i])) for i in order]
+        radius *= 2
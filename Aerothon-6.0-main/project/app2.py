@@ -1,80 +1,35 @@
-from flask import Flask, render_template, request
-import requests
-from itertools import permutations
-from math import radians, sin, cos, sqrt, atan2
+from flask import Flask, render_template, request, jsonify
+from route_optimizer import find_optimal_routes, find_top_routes, iter_routes
+from route_risk import find_safest_routes
+from weather_cache import get_current_weather_many
+from risk_engine import categorize
+from airport_registry import get_airport_coordinates, nearest_airports
+from path_planner import (DEFAULT_CELL_DEGREES, MAX_CELL_DEGREES, MAX_GRID_CELLS, MIN_CELL_DEGREES, build_grid,
+                          build_risk_raster, plan_path)
+from live_traffic import MAX_SEARCH_FT, MAX_SEARCH_KM, SEPARATION_FT, SEPARATION_KM, get_traffic_index
+from metrics import instrument_app, span
+from profiling import instrument_profiling
 
 app = Flask(__name__)
+# Request latency histograms, with the stage spans below, served on /metrics
+instrument_app(app, 'route_planner')
+# Opt-in per-request profiles, listed on /profiles
+instrument_profiling(app, 'route_planner')
 
-thresholds = {
-    "temperature_2m": {"low": 10, "medium": 20, "high": 30},
-    "relative_humidity_2m": {"low": 30, "medium": 60, "high": 90},
-    "precipitation": {"low": 0.1, "medium": 1, "high": 5},
-    "rain": {"low": 0.1, "medium": 1, "high": 5},
-    "snowfall": {"low": 1, "medium": 5, "high": 10},
-    "cloud_cover": {"low": 0.1, "medium": 0.5, "high": 0.8},
-    "pressure_msl": {"low": 980, "medium": 1000, "high": 1020},
-    "surface_pressure": {"low": 980, "medium": 1000, "high": 1020},
-    "wind_speed_10m": {"low": 5, "medium": 10, "high": 20},
-    "wind_direction_10m": {"low": 0, "medium": 180, "high": 360},
-    "wind_gusts_10m": {"low": 10, "medium": 20, "high": 30}
-}
-
-def get_airport_coordinates(code):
-    airport_coords = {
-        'SFO': (37.7749, -122.4194),
-        'DFW': (32.8998, -97.0403),
-        'DEN': (39.8561, -104.6737),
-        'LAX': (33.9416, -118.4085),
-        'ORD': (41.9742, -87.9073)
-    }
-    return airport_coords.get(code, (0.0, 0.0))
-
-def haversine(coord1, coord2):
-    R = 6371.0
-    lat1, lon1 = radians(float(coord1[0])), radians(float(coord1[1]))
-    lat2, lon2 = radians(float(coord2[0])), radians(float(coord2[1]))
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
-def calculate_total_distance(route):
-    total_distance = 0
-    for i in range(len(route) - 1):
-        total_distance += haversine(route[i], route[i + 1])
-    return total_distance
+# Enumerating every permutation is only practical for a handful of waypoints
+MAX_BRUTE_FORCE_WAYPOINTS = 7
+# Most routes a single request can ask for with k or top
+MAX_ROUTES = 100
+# Most waypoints a route may have. The exact search grows exponentially with
+# the count, so more would tie up a worker for seconds or minutes.
+MAX_WAYPOINTS = 25
 
 def find_all_routes(start, end, waypoints):
-    all_routes = []
-    for perm in permutations(waypoints):
-        route = [start] + list(perm) + [end]
-        total_distance = calculate_total_distance(route)
-        all_routes.append((route, total_distance))
-    return sorted(all_routes, key=lambda x: x[1])
+    return sorted(iter_routes(start, end, waypoints), key=lambda x: x[1])
 
-def get_weather_data(latitude, longitude):
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {"latitude": latitude, "longitude": longitude, "current_weather": True}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        current_weather = data.get('current_weather', {})
-        return current_weather
-    else:
-        return None
-
-def categorize_weather(weather_data, thresholds):
-    categories = {}
-    for key, value in weather_data.items():
-        if key in thresholds:
-            if thresholds[key]["low"] <= value <= thresholds[key]["medium"]:
-                categories[key] = "Fair"
-            elif value > thresholds[key]["medium"]:
-                categories[key] = "Danger"
-            else:
-                categories[key] = "Good"
-    return categories
+# Only the shortest k routes, found without enumerating every permutation
+def find_best_routes(start, end, waypoints, k=1):
+    return find_optimal_routes(start, end, waypoints, k=k)
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -85,21 +40,135 @@ def index():
         departure = request.form['departure']
         arrival = request.form['arrival']
         waypoint_str = request.form['waypoints'].replace('\r', '').replace(' ', ',')
-        waypoints = [tuple(map(float, wp.split(','))) for wp in waypoint_str.split('\n') if wp.strip()]
+        try:
+            waypoints = [tuple(map(float, wp.split(','))) for wp in waypoint_str.split('\n') if wp.strip()]
+        except ValueError:
+            return render_template('index1.html', error="Waypoints must be latitude,longitude pairs")
         start = get_airport_coordinates(departure)
         end = get_airport_coordinates(arrival)
-        routes = find_all_routes(start, end, waypoints)
+        if start is None or end is None:
+            return render_template('index1.html', error="Unknown departure or arrival airport")
+        if len(waypoints) > MAX_WAYPOINTS:
+            return render_template('index1.html', error=f"At most {MAX_WAYPOINTS} waypoints are supported")
+        mode = request.form.get('mode', 'all')
+        top = request.args.get('top', type=int)
+        if top is not None:
+            top = max(1, min(top, MAX_ROUTES))
+        k = top or max(1, min(request.form.get('k', 1, type=int), MAX_ROUTES))
         route_info = []
-        for route, distance in routes:
-            route_info.append({'route': route, 'distance': distance})
+        with span('route_search'):
+            if mode == 'safest':
+                for route, distance, cost in find_safest_routes(start, end, waypoints, k=k):
+                    route_info.append({'route': route, 'distance': distance, 'cost': cost})
+            else:
+                if mode == 'optimal' or len(waypoints) > MAX_BRUTE_FORCE_WAYPOINTS:
+                    routes = find_best_routes(start, end, waypoints, k=k)
+                elif top:
+                    routes = find_top_routes(start, end, waypoints, top)
+                else:
+                    routes = find_all_routes(start, end, waypoints)
+                for route, distance in routes:
+                    route_info.append({'route': route, 'distance': distance})
         if start and end:
-            weather_info_start = get_weather_data(start[0], start[1])
-            weather_info_end = get_weather_data(end[0], end[1])
-            weather_info_start = categorize_weather(weather_info_start, thresholds) if weather_info_start else {}
-            weather_info_end = categorize_weather(weather_info_end, thresholds) if weather_info_end else {}
+            # Both airports are fetched at once, so the page waits for the slower one only
+            weather_info_start, weather_info_end = get_current_weather_many([start, end])
+            with span('risk_scoring'):
+                weather_info_start = categorize(weather_info_start) if weather_info_start else {}
+                weather_info_end = categorize(weather_info_end) if weather_info_end else {}
     return render_template('index1.html', route_info=route_info, 
                            weather_info_start=weather_info_start, 
                            weather_info_end=weather_info_end)
 
+@app.route('/plan_route', methods=['POST'])
+def plan_route():
+    data = request.get_json()
+    start = get_airport_coordinates(data['departure'])
+    end = get_airport_coordinates(data['arrival'])
+    if start is None or end is None:
+        return jsonify({"error": "Unknown departure or arrival airport"}), 404
+
+    try:
+        cell_degrees = float(data.get('cell_degrees', DEFAULT_CELL_DEGREES))
+    except (TypeError, ValueError):
+        return jsonify({"error": "cell_degrees must be a number"}), 400
+    if not MIN_CELL_DEGREES <= cell_degrees <= MAX_CELL_DEGREES:
+        return jsonify({"error": f"cell_degrees must be between {MIN_CELL_DEGREES} and {MAX_CELL_DEGREES}"}), 400
+
+    lats, lons = build_grid(start, end, cell_degrees)
+    # Checked before any weather is fetched for the raster
+    if len(lats) * len(lons) > MAX_GRID_CELLS:
+        return jsonify({"error": f"Grid of {len(lats) * len(lons)} cells exceeds the limit of {MAX_GRID_CELLS}; "
+                                 "use larger cells"}), 400
+    with span('risk_scoring'):
+        risk = build_risk_raster(lats, lons)
+    with span('route_search'):
+        planned = plan_path(start, end, lats, lons, risk)
+    if planned is None:
+        return jsonify({"error": "No path found between the airports"}), 422
+
+    path, distance, cost = planned
+    return jsonify({"route": path, "distance": distance, "cost": cost})
+
+@app.route('/nearest_airports', methods=['GET'])
+def nearest():
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    if latitude is None or longitude is None:
+        return jsonify({"error": "lat and lon are required"}), 400
+    if not (abs(latitude) <= 90 and abs(longitude) <= 180):
+        return jsonify({"error": "lat must be within 90 and lon within 180 degrees"}), 400
+    k = max(1, min(request.args.get('k', 5, type=int), 100))
+    airports = nearest_airports(latitude, longitude, k, iata_only=request.args.get('iata_only') == '1')
+    return jsonify([dict(airport._asdict(), distance=distance) for airport, distance in airports])
+
+# Live position of a flight in the traffic index as JSON
+def position_json(position):
+    flight_iata, flight_date, departure_scheduled = position.key
+    return {
+        "flight_iata": flight_iata, "flight_date": str(flight_date), "departure_scheduled": str(departure_scheduled),
+        "latitude": position.latitude, "longitude": position.longitude, "altitude": position.altitude,
+        "direction": position.direction, "speed": position.speed,
+        "updated": position.updated.isoformat() if position.updated else None,
+    }
+
+# Search limits of a traffic query, or an error response if they are out of range
+def traffic_limits():
+    radius_km = request.args.get('radius_km', SEPARATION_KM, type=float)
+    vertical_ft = request.args.get('vertical_ft', SEPARATION_FT, type=float)
+    if not (0 < radius_km <= MAX_SEARCH_KM and 0 < vertical_ft <= MAX_SEARCH_FT):
+        return None, None, (jsonify({"error": f"radius_km must be in (0, {MAX_SEARCH_KM}] and "
+                                              f"vertical_ft in (0, {MAX_SEARCH_FT}]"}), 400)
+    return radius_km, vertical_ft, None
+
+@app.route('/traffic/nearby', methods=['GET'])
+def traffic_nearby():
+    flight = request.args.get('flight', '').strip().upper()
+    radius_km, vertical_ft, error = traffic_limits()
+    if error:
+        return error
+    with span('traffic_search'):
+        found = get_traffic_index().nearby(flight, radius_km, vertical_ft)
+    if found is None:
+        return jsonify({"error": f"No live position for flight {flight}"}), 404
+    return jsonify([dict(position_json(position), distance_km=distance, vertical_ft=vertical)
+                    for position, distance, vertical in found])
+
+@app.route('/traffic/conflicts', methods=['GET'])
+def traffic_conflicts():
+    radius_km, vertical_ft, error = traffic_limits()
+    if error:
+        return error
+    limit = max(0, min(request.args.get('limit', 100, type=int), 1000))
+    with span('traffic_search'):
+        index = get_traffic_index()
+        conflicts = index.conflicts(radius_km, vertical_ft)
+    return jsonify({
+        "flights": len(index),
+        "conflicts": len(conflicts),
+        "pairs": [{"first": position_json(first), "second": position_json(second),
+                   "distance_km": distance, "vertical_ft": vertical}
+                  for first, second, distance, vertical in conflicts[:limit]],
+    })
+
 if __name__ == "__main__":
     app.run(debug=True)
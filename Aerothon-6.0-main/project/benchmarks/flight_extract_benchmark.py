@@ -0,0 +1,57 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from flight_schema import compile_extractor, field_mapping
+from stub_apis import fake_flight
+
+# The old approach: flatten the whole record recursively, then look every mapped key up
+def flatten(data, parent_key='', sep='.'):
+    items = []
+    for k, v in data.items():
+        new_key = f'{parent_key}{sep}{k}' if parent_key else k
+        if isinstance(v, dict):
+            items.extend(flatten(v, new_key, sep=sep).items())
+        else:
+            items.append((new_key, v))
+    return dict(items)
+
+def flatten_rows(records):
+    return [[item.get(key, None) for key in field_mapping.keys()] for item in map(flatten, records)]
+
+def extractor_rows(records):
+    extract = compile_extractor(field_mapping)
+    return [extract(record) for record in records]
+
+# Best of several runs, in seconds
+def best_time(convert, records, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        began = time.perf_counter()
+        convert(records)
+        best = min(best, time.perf_counter() - began)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recursive flatten with the compiled flight extractor")
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    records = [fake_flight(index, rng) for index in range(args.records)]
+
+    # Both approaches must produce the same rows
+    assert [tuple(row) for row in flatten_rows(records[:1000])] == extractor_rows(records[:1000])
+
+    baseline = best_time(flatten_rows, records, args.repeat)
+    compiled = best_time(extractor_rows, records, args.repeat)
+    for name, elapsed in (('flatten', baseline), ('compiled', compiled)):
+        print(f"{name:>9}: {elapsed:6.3f} s  {args.records / elapsed:10,.0f} records/s")
+    print(f"  speedup: {baseline / compiled:.1f}x")
+
+if __name__ == '__main__':
+    main()
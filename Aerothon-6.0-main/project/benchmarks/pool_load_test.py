@@ -0,0 +1,80 @@
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db_pool
+
+QUERY = """
+SELECT temperature_2m, relative_humidity_2m, precipitation, rain, snowfall, cloud_cover, pressure_msl,
+       surface_pressure, wind_speed_10m, wind_direction_10m, wind_gusts_10m
+FROM current_weather
+WHERE latitude = %s AND longitude = %s
+"""
+
+# One lookup the way app.py used to do it: connect, query, close
+def direct_lookup():
+    conn = psycopg2.connect(**db_pool.db_params)
+    cursor = conn.cursor()
+    cursor.execute(QUERY, (32.8998, -97.0403))
+    cursor.fetchone()
+    conn.close()
+
+# The same lookup on a borrowed pooled connection
+def pooled_lookup():
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(QUERY, (32.8998, -97.0403))
+        cursor.fetchone()
+
+# Run lookup from several threads at once and collect per-call latencies in ms
+def run(lookup, threads, requests_per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(requests_per_thread):
+            began = time.perf_counter()
+            lookup()
+            local.append((time.perf_counter() - began) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    began = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return latencies, time.perf_counter() - began
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def report(name, latencies, elapsed):
+    print(f"{name:>8}: {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50 {percentile(latencies, 0.50):7.2f} ms  "
+          f"p99 {percentile(latencies, 0.99):7.2f} ms  "
+          f"mean {statistics.mean(latencies):7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request connections with the shared pool")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="requests per thread")
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    db_pool.init_pool(1, args.pool_size)
+    report('direct', *run(direct_lookup, args.threads, args.requests))
+    report('pooled', *run(pooled_lookup, args.threads, args.requests))
+    db_pool.close_pool()
+
+if __name__ == '__main__':
+    main()
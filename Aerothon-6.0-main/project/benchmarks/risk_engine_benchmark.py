@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import risk_engine
+from weather_schema import weather_columns
+
+# How app.py scored a point before the risk engine: the thresholds dict
+# literal was rebuilt on every call
+def legacy_risk_assessment(weather_data):
+    thresholds = {
+        "temperature_2m": {"low": 10, "medium": 20, "high": 30},
+        "relative_humidity_2m": {"low": 30, "medium": 60, "high": 90},
+        "precipitation": {"low": 0.1, "medium": 1, "high": 5},
+        "rain": {"low": 0.1, "medium": 1, "high": 5},
+        "snowfall": {"low": 1, "medium": 5, "high": 10},
+        "cloud_cover": {"low": 0.1, "medium": 0.5, "high": 0.8},
+        "pressure_msl": {"low": 980, "medium": 1000, "high": 1020},
+        "surface_pressure": {"low": 980, "medium": 1000, "high": 1020},
+        "wind_speed_10m": {"low": 5, "medium": 10, "high": 20},
+        "wind_direction_10m": {"low": 0, "medium": 180, "high": 360},
+        "wind_gusts_10m": {"low": 10, "medium": 20, "high": 30}
+    }
+    risk_assessment = 0
+    for param, value in weather_data.items():
+        if value < thresholds[param]["low"]:
+            risk_assessment += 1
+        elif value < thresholds[param]["medium"]:
+            risk_assessment += 2
+        else:
+            risk_assessment += 3
+    return risk_assessment
+
+def legacy_risk_level(risk_assessment):
+    if risk_assessment < 20:
+        return "Low"
+    elif risk_assessment < 40:
+        return "Medium"
+    return "High"
+
+def engine_scalar(weather_data):
+    return risk_engine.risk_level(risk_engine.score(weather_data))
+
+def legacy(weather_data):
+    return legacy_risk_level(legacy_risk_assessment(weather_data))
+
+def per_call_us(function, points, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        began = time.perf_counter()
+        for weather_data in points:
+            function(weather_data)
+        best = min(best, time.perf_counter() - began)
+    return best / len(points) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-call risk scoring with the shared risk engine")
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    values = rng.uniform(0, 1100, size=(args.points, len(weather_columns)))
+    points = [dict(zip(weather_columns, row)) for row in values.tolist()]
+
+    # All three paths must agree
+    sample = points[:1000]
+    assert [legacy(p) for p in sample] == [engine_scalar(p) for p in sample]
+    assert [legacy(p) for p in sample] == risk_engine.risk_level_batch(
+        risk_engine.score_batch(values[:1000], weather_columns)).tolist()
+
+    legacy_us = per_call_us(legacy, points, args.repeat)
+    engine_us = per_call_us(engine_scalar, points, args.repeat)
+    began = time.perf_counter()
+    risk_engine.risk_level_batch(risk_engine.score_batch(values, weather_columns))
+    batch_us = (time.perf_counter() - began) / args.points * 1e6
+
+    print(f"  legacy scalar: {legacy_us:7.3f} us/point")
+    print(f"  engine scalar: {engine_us:7.3f} us/point  ({legacy_us / engine_us:.1f}x)")
+    print(f"   engine batch: {batch_us:7.3f} us/point  ({legacy_us / batch_us:.1f}x)")
+
+if __name__ == '__main__':
+    main()
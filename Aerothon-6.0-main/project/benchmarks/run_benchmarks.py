@@ -0,0 +1,326 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.join(BENCHMARKS_DIR, '..')
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'data_collection'))
+from stub_apis import StubHandler
+from synthetic import flight_payload, flight_records, random_waypoints, weather_grid, weather_values
+
+# Results land here as <commit>.json unless --output says otherwise
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+# Bump when the layout of the results file changes
+RESULTS_FORMAT = 1
+# A benchmark whose throughput drops by more than this against the baseline is a regression
+REGRESSION_THRESHOLD = 0.10
+suites = ['routing', 'risk', 'ingestion', 'traffic', 'http']
+
+# Call call() iterations times after warmup calls and summarise the
+# per-call latencies. items is the work done per call (points scored, rows
+# stored, ...), so throughput is comparable across sizes. Progress output of
+# the code under test is swallowed.
+def measure(name, call, iterations, items=1, warmup=1, **params):
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            call()
+        for _ in range(iterations):
+            began = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - began)
+    return summarise(name, np.array(latencies), sum(latencies), items, params)
+
+# Call call() from several threads at once, calls_per_thread times each
+def measure_concurrent(name, call, threads, calls_per_thread, items=1, warmup=1, **params):
+    latencies = [[] for _ in range(threads)]
+
+    def worker(own):
+        for _ in range(calls_per_thread):
+            began = time.perf_counter()
+            call()
+            own.append(time.perf_counter() - began)
+
+    workers = [threading.Thread(target=worker, args=(own,)) for own in latencies]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            call()
+        began = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - began
+    params['threads'] = threads
+    return summarise(name, np.concatenate([np.array(own) for own in latencies]), elapsed, items, params)
+
+def summarise(name, latencies, elapsed, items, params):
+    ms = latencies * 1000
+    result = {
+        "name": name,
+        "params": params,
+        "calls": len(latencies),
+        "items_per_call": items,
+        "throughput": len(latencies) * items / elapsed,
+        "mean_ms": float(ms.mean()),
+        "min_ms": float(ms.min()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+    print(f"  {name:<42} {result['throughput']:>14,.1f} items/s  p50 {result['p50_ms']:9.3f} ms  "
+          f"p90 {result['p90_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms")
+    return result
+
+def bench_routing(scale, seed):
+    from app2 import find_all_routes
+    from route_optimizer import find_optimal_routes
+    results = []
+    points = random_waypoints(7 + 2, seed)
+    results.append(measure('routing.find_all_routes[7]', lambda: find_all_routes(points[0], points[1], points[2:]),
+                           max(3, 10 // scale), waypoints=7))
+    for waypoints, k in ((12, 1), (20, 3)):
+        points = random_waypoints(waypoints + 2, seed)
+        results.append(measure(f'routing.find_optimal_routes[{waypoints},k={k}]',
+                               lambda: find_optimal_routes(points[0], points[1], points[2:], k=k),
+                               max(3, 20 // scale), waypoints=waypoints, k=k))
+    return results
+
+def bench_risk(scale, seed):
+    import risk_engine
+    from weather_schema import weather_columns
+    count = 100000 // scale
+    values = weather_values(count, weather_columns, seed)
+    points = [dict(zip(weather_columns, row)) for row in values[:10000 // scale].tolist()]
+
+    def score_points():
+        for weather_data in points:
+            risk_engine.risk_level(risk_engine.score(weather_data))
+
+    def score_batch():
+        risk_engine.risk_level_batch(risk_engine.score_batch(values, weather_columns))
+
+    return [
+        measure('risk.score', score_points, 10, items=len(points), points=len(points)),
+        measure('risk.score_batch', score_batch, 10, items=count, points=count),
+    ]
+
+def bench_ingestion(scale, seed):
+    from flight_ingest import iter_json_array
+    from flight_schema import flight_rows
+    from storage import get_storage
+    from weather_schema import weather_columns
+    storage = get_storage()
+    storage.setup()
+    results = []
+
+    count = 20000 // scale
+    records = flight_records(count, seed)
+    results.append(measure('ingestion.flight_rows', lambda: list(flight_rows(records)), 5, items=count,
+                           records=count))
+
+    body = json.dumps(flight_payload(count, seed)).encode()
+    chunks = [body[offset:offset + 65536] for offset in range(0, len(body), 65536)]
+    results.append(measure('ingestion.iter_json_array', lambda: sum(1 for _ in iter_json_array(chunks)), 5,
+                           items=count, records=count, bytes=len(body)))
+
+    # Every call stores flights not seen before, like a poll during a busy hour
+    count = 5000 // scale
+    iterations = 5
+    pages = iter([list(flight_rows(flight_records(count, seed, offset=(page + 1) * count)))
+                  for page in range(iterations + 1)])
+    results.append(measure(f'ingestion.store_flight_data[{storage.name}]',
+                           lambda: storage.sync_flights(next(pages)), iterations, items=count, rows=count))
+
+    batch = weather_grid(0.5 if scale == 1 else 2, weather_columns, seed)
+    rows = len(batch['latitude'])
+    results.append(measure(f'ingestion.store_weather_data[{storage.name}]', lambda: storage.store_weather(batch),
+                           5, items=rows, rows=rows))
+    return results
+
+def bench_traffic(scale, seed):
+    from flight_schema import field_mapping, flight_rows, live_columns
+    from live_traffic import TrafficIndex
+    count = 30000 // scale
+    columns = list(field_mapping.values())
+    positions = [columns.index(column) for column in live_columns]
+    rows = [[row[i] for i in positions] for row in flight_rows(flight_records(count, seed))]
+    # Everything airborne, so each call moves every flight
+    for row in rows:
+        row[-1] = False
+    index = TrafficIndex()
+    results = [measure('traffic.update_rows', lambda: index.update_rows(rows), 5, items=count, flights=count)]
+    flights = [row[0] for row in rows[:1000 // scale]]
+    results.append(measure('traffic.nearby', lambda: [index.nearby(flight) for flight in flights], 5,
+                           items=len(flights), flights=count))
+    results.append(measure('traffic.conflicts', index.conflicts, 5, items=count, flights=count))
+    return results
+
+def bench_http(scale, seed, stub_url):
+    import requests
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import app
+    from storage import get_storage
+    from weather_cache import fetch_current_weather
+    from weather_schema import weather_columns
+
+    # Observations every half degree, so every point is in range
+    storage = get_storage()
+    storage.setup()
+    storage.store_weather(weather_grid(0.5, weather_columns, seed))
+
+    results = []
+    client = app.test_client()
+    points = random_waypoints(1000, seed)
+    cursor = iter(points * 1000)
+
+    def risk_assessment():
+        latitude, longitude = next(cursor)
+        response = client.post('/risk_assessment', json={"latitude": latitude, "longitude": longitude})
+        assert response.status_code == 200, response.status_code
+
+    batch = {"points": [list(point) for point in points[:100]]}
+
+    def risk_assessment_batch():
+        assert client.post('/risk_assessment/batch', json=batch).status_code == 200
+
+    results.append(measure('http.risk_assessment', risk_assessment, 500 // scale))
+    results.append(measure('http.risk_assessment_batch[100]', risk_assessment_batch, 100 // scale, items=100,
+                           points=100))
+
+    # The same endpoint over real sockets, from several clients at once
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/risk_assessment"
+    local = threading.local()
+
+    def risk_assessment_socket():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        session = local.session
+        latitude, longitude = next(cursor)
+        response = session.post(url, json={"latitude": latitude, "longitude": longitude})
+        assert response.status_code == 200, response.status_code
+
+    results.append(measure_concurrent('http.risk_assessment[socket]', risk_assessment_socket, 8, 200 // scale))
+    server.shutdown()
+
+    # Current weather from the stubbed Open-Meteo server, as the route pages fetch it
+    results.append(measure_concurrent('http.open_meteo_current_weather[stub]',
+                                      lambda: fetch_current_weather(*next(cursor)), 8, 100 // scale))
+    return results
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=PROJECT_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return git('rev-parse', '--short', 'HEAD') or 'unknown', bool(git('status', '--porcelain', '--untracked-files=no'))
+    except OSError:
+        return 'unknown', False
+
+# Print every benchmark against the baseline and return the names that regressed
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    before = {result['name']: result for result in baseline['results']}
+    print(f"\nAgainst {baseline.get('commit', '?')} ({baseline.get('timestamp', '?')}):")
+    regressed = []
+    for result in current['results']:
+        old = before.get(result['name'])
+        if old is None:
+            print(f"  {result['name']:<42} new")
+            continue
+        change = result['throughput'] / old['throughput'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressed.append(result['name'])
+        print(f"  {result['name']:<42} throughput {change:+7.1%}  p50 {old['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} ms{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and save the results as JSON")
+    parser.add_argument('--suite', action='append', choices=suites, help="Suites to run (default: all)")
+    parser.add_argument('--quick', action='store_true', help="Tenth-size inputs, for a smoke test")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--storage', choices=['sqlite', 'postgres'], default='sqlite',
+                        help="Backend for the ingestion and endpoint suites (sqlite uses a throwaway file)")
+    parser.add_argument('--output', help="Results file (default: results/<commit>.json)")
+    parser.add_argument('--compare', help="Baseline results file to compare against")
+    parser.add_argument('--results', help="Compare this results file instead of running the suite")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        scale = 10 if args.quick else 1
+        # The stub server and storage backend must be in place before the
+        # project modules read their settings
+        stub = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        stub_url = f"http://127.0.0.1:{stub.server_port}/v1/forecast"
+        os.environ['OPEN_METEO_URL'] = stub_url
+        os.environ['STORAGE_BACKEND'] = args.storage
+        workdir = tempfile.mkdtemp(prefix='benchmarks-')
+        if args.storage == 'sqlite':
+            os.environ['SQLITE_PATH'] = os.path.join(workdir, 'benchmark.db')
+
+        commit, dirty = git_commit()
+        current = {
+            "format": RESULTS_FORMAT,
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "quick": args.quick,
+            "storage": args.storage,
+            "results": [],
+        }
+        for suite in args.suite or suites:
+            print(f"{suite}:")
+            if suite == 'http':
+                current['results'] += bench_http(scale, args.seed, stub_url)
+            else:
+                current['results'] += globals()[f'bench_{suite}'](scale, args.seed)
+        stub.shutdown()
+
+        from storage import close_storage
+        close_storage()
+        shutil.rmtree(workdir, ignore_errors=True)
+        output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), current)
+        if regressed and args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Stand-ins for the Open-Meteo forecast and aviationstack flights APIs, so the
+# collectors can be run and load tested offline. Point them here with
+#   OPEN_METEO_URL=http://localhost:8090/v1/forecast
+#   AVIATIONSTACK_URL=http://localhost:8090/v1/flights
+
+airports = ['SFO', 'DFW', 'DEN', 'LAX', 'ORD', 'JFK', 'ATL', 'SEA']
+
+def fake_current(variables, rng):
+    current = {"time": int(time.time()) // 900 * 900, "interval": 900}
+    for name in variables:
+        current[name] = round(rng.uniform(0, 100), 1)
+    return current
+
+# The legacy current_weather block the route pages read
+def fake_current_weather(rng):
+    return {"time": int(time.time()) // 900 * 900, "interval": 900,
+            "temperature": round(rng.uniform(-10, 35), 1), "windspeed": round(rng.uniform(0, 60), 1),
+            "winddirection": rng.randint(0, 359), "is_day": 1, "weathercode": rng.choice([0, 1, 2, 3, 61, 95])}
+
+def fake_hourly(variables, days, rng):
+    start = int(time.time()) // 3600 * 3600
+    hours = days * 24
+    hourly = {"time": [start + hour * 3600 for hour in range(hours)]}
+    for name in variables:
+        hourly[name] = [round(rng.uniform(0, 100), 1) for _ in range(hours)]
+    return hourly
+
+def fake_flight(index, rng):
+    # Schedules stay put between polls, live positions move on
+    now = datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    departure, arrival = rng.sample(airports, 2)
+    scheduled = today + timedelta(minutes=rng.randint(0, 1200))
+    return {
+        "flight_date": scheduled.date().isoformat(),
+        "flight_status": rng.choice(["scheduled", "active", "landed"]),
+        "departure": {"airport": departure, "iata": departure, "icao": "K" + departure,
+                      "delay": rng.choice([None, rng.randint(0, 90)]), "scheduled": scheduled.isoformat()},
+        "arrival": {"airport": arrival, "iata": arrival, "icao": "K" + arrival,
+                    "scheduled": (scheduled + timedelta(hours=3)).isoformat()},
+        "airline": {"name": "Stub Air", "iata": "SA", "icao": "STB"},
+        "flight": {"number": str(index), "iata": f"SA{index}", "icao": f"STB{index}"},
+        "live": {"updated": now.isoformat(), "latitude": rng.uniform(25, 49), "longitude": rng.uniform(-124, -67),
+                 "altitude": rng.uniform(0, 12000), "direction": rng.uniform(0, 360),
+                 "speed_horizontal": rng.uniform(0, 900), "speed_vertical": 0.0, "is_ground": False},
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    total_flights = 1000
+
+    def send_json(self, body):
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        rng = random.Random(self.path)
+        time.sleep(self.latency)
+
+        if url.path == "/v1/forecast":
+            lats = query.get("latitude", "0").split(",")
+            lons = query.get("longitude", "0").split(",")
+            locations = [{"latitude": float(lat), "longitude": float(lon)} for lat, lon in zip(lats, lons)]
+            for location in locations:
+                if "current" in query:
+                    location["current"] = fake_current(query["current"].split(","), rng)
+                if query.get("current_weather") in ("True", "true"):
+                    location["current_weather"] = fake_current_weather(rng)
+                if "hourly" in query:
+                    location["hourly"] = fake_hourly(query["hourly"].split(","), int(query.get("forecast_days", 7)), rng)
+            self.send_json(locations[0] if len(locations) == 1 else locations)
+        elif url.path == "/v1/flights":
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", 100))
+            count = max(0, min(limit, self.total_flights - offset))
+            self.send_json({
+                "pagination": {"limit": limit, "offset": offset, "count": count, "total": self.total_flights},
+                "data": [fake_flight(index, rng) for index in range(offset, offset + count)],
+            })
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub Open-Meteo and aviationstack APIs")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--flights', type=int, default=1000, help="Flights reported in total")
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    StubHandler.total_flights = args.flights
+    server = ThreadingHTTPServer(('localhost', args.port), StubHandler)
+    print(f"Stub APIs listening on http://localhost:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
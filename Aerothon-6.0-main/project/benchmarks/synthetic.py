@@ -0,0 +1,70 @@
+import random
+from datetime import datetime
+
+import numpy as np
+
+from stub_apis import fake_flight
+
+# Synthetic inputs for the benchmarks. Everything is drawn from a seeded
+# generator, so the same seed gives the same data on every commit.
+
+# Airspace the generators draw from: the continental US
+US_BOX = (24.0, -125.0, 50.0, -66.0)
+
+# Plausible range of every weather variable, so scores spread over all risk levels
+weather_ranges = {
+    "temperature_2m": (-20, 40),
+    "relative_humidity_2m": (0, 100),
+    "precipitation": (0, 8),
+    "rain": (0, 8),
+    "snowfall": (0, 12),
+    "cloud_cover": (0, 1),
+    "pressure_msl": (960, 1040),
+    "surface_pressure": (940, 1040),
+    "wind_speed_10m": (0, 30),
+    "wind_direction_10m": (0, 360),
+    "wind_gusts_10m": (0, 45),
+}
+
+# count random (latitude, longitude) waypoints inside box
+def random_waypoints(count, seed=0, box=US_BOX):
+    rng = np.random.default_rng(seed)
+    south, west, north, east = box
+    lats = rng.uniform(south, north, count).round(4)
+    lons = rng.uniform(west, east, count).round(4)
+    return list(zip(lats.tolist(), lons.tolist()))
+
+# A (count, variables) array of weather values in weather_ranges, columns in names order
+def weather_values(count, names, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(*weather_ranges[name], count) for name in names])
+
+# A columnar weather batch, shaped like the collectors' output, for a regular
+# grid of locations every step degrees over box
+def weather_grid(step, names, seed=0, box=US_BOX, when=None):
+    south, west, north, east = box
+    lats, lons = np.meshgrid(np.arange(south, north + step / 2, step), np.arange(west, east + step / 2, step),
+                             indexing='ij')
+    count = lats.size
+    when = when or datetime.now().replace(minute=0, second=0, microsecond=0)
+    batch = {
+        'time': [when] * count,
+        'latitude': lats.ravel().round(4),
+        'longitude': lons.ravel().round(4),
+    }
+    values = weather_values(count, names, seed)
+    for column, name in enumerate(names):
+        batch[name] = values[:, column].astype(np.float32)
+    return batch
+
+# count aviationstack flight records, numbered from offset
+def flight_records(count, seed=0, offset=0):
+    rng = random.Random(seed)
+    return [fake_flight(index, rng) for index in range(offset, offset + count)]
+
+# One page of the aviationstack flights API, as the JSON body it would return
+def flight_payload(count, seed=0, offset=0, total=None):
+    return {
+        "pagination": {"limit": count, "offset": offset, "count": count, "total": total or offset + count},
+        "data": flight_records(count, seed, offset),
+    }
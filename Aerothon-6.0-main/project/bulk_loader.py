@@ -0,0 +1,72 @@
+import csv
+import io
+import time
+
+import numpy as np
+
+# Rows written to the in-memory buffer before it is flushed to COPY
+COPY_CHUNK_ROWS = 50000
+
+def _csv_value(value):
+    # NaN and None both become an unquoted empty field, which COPY reads as NULL
+    if value is None or value != value:
+        return None
+    return value
+
+def _copy_buffer(cursor, statement, buffer):
+    buffer.seek(0)
+    cursor.copy_expert(statement, buffer)
+
+def report_load(table, loaded, started):
+    elapsed = time.perf_counter() - started
+    rate = loaded / elapsed if elapsed > 0 else float('inf')
+    print(f"Loaded {loaded} rows into {table} in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    return loaded, rate
+
+# Function to stream rows into a table with COPY ... FROM STDIN in CSV form.
+# Rows are buffered in memory a chunk at a time, so any iterable works.
+# Returns the number of rows loaded and the rows/sec achieved.
+def copy_rows(conn, table, columns, rows, chunk_rows=COPY_CHUNK_ROWS):
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    started = time.perf_counter()
+    loaded = 0
+    with conn.cursor() as cursor:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        pending = 0
+        for row in rows:
+            writer.writerow([_csv_value(value) for value in row])
+            pending += 1
+            if pending >= chunk_rows:
+                _copy_buffer(cursor, statement, buffer)
+                loaded += pending
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                pending = 0
+        if pending:
+            _copy_buffer(cursor, statement, buffer)
+            loaded += pending
+    conn.commit()
+    return report_load(table, loaded, started)
+
+def _column_text(values):
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        # NumPy formats whole float columns at once, much faster than csv
+        text = values.astype(str)
+        text[np.isnan(values)] = ''
+        return text.tolist()
+    return ['' if value is None else str(value) for value in values]
+
+# Function to COPY a columnar batch (a dict of equally long columns) into a
+# table. Meant for numeric and timestamp columns, which need no CSV quoting.
+def copy_columns(conn, table, batch, columns, chunk_rows=COPY_CHUNK_ROWS):
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    started = time.perf_counter()
+    count = len(batch[columns[0]])
+    with conn.cursor() as cursor:
+        for offset in range(0, count, chunk_rows):
+            text = [_column_text(batch[column][offset:offset + chunk_rows]) for column in columns]
+            lines = '\n'.join(','.join(row) for row in zip(*text))
+            _copy_buffer(cursor, statement, io.StringIO(lines + '\n'))
+    conn.commit()
+    return report_load(table, count, started)
@@ -0,0 +1,120 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+# Shared modules live in the project directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from collect_data import airport_locations, grid_locations
+from forecast_store import HOUR, create_run, discard_run, forecast_variables, publish_run
+
+# Open-Meteo endpoint, overridable so ingestion can run against a local stub server
+OPEN_METEO_URL = os.environ.get('OPEN_METEO_URL', 'https://api.open-meteo.com/v1/forecast')
+# Days of hourly forecast stored per location
+FORECAST_DAYS = 2
+# Coordinates sent in one multi-location request
+FORECAST_CHUNK_SIZE = 100
+# Chunk requests run at once
+FORECAST_WORKERS = 4
+REQUEST_TIMEOUT = 60
+
+# Function to fetch the hourly forecast for one chunk of locations. Returns
+# one {'time': [...], variable: [...]} dict per location, in order.
+def fetch_forecast_chunk(session, chunk, days=FORECAST_DAYS):
+    params = {
+        "latitude": ",".join(f"{lat:.4f}" for lat, _ in chunk),
+        "longitude": ",".join(f"{lon:.4f}" for _, lon in chunk),
+        "hourly": ",".join(forecast_variables),
+        "forecast_days": days,
+        "timeformat": "unixtime",
+    }
+    response = session.get(OPEN_METEO_URL, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    # A single location comes back as an object rather than a list
+    if isinstance(data, dict):
+        data = [data]
+    return [location.get('hourly', {}) for location in data]
+
+# Function to start a forecast run for the locations at the current hour.
+# Returns the run directory, its arrays and the run's start time.
+def begin_forecast(locations, days=FORECAST_DAYS):
+    start = int(time.time()) // HOUR * HOUR
+    run, arrays = create_run(locations, start, days * 24)
+    return run, arrays, start
+
+# The locations split into (offset, chunk) pairs of one request each
+def forecast_chunks(locations):
+    return [(offset, locations[offset:offset + FORECAST_CHUNK_SIZE])
+            for offset in range(0, len(locations), FORECAST_CHUNK_SIZE)]
+
+# Function to write one chunk's hourly blocks into the run's arrays, starting
+# at row offset. Returns the number of locations stored.
+def store_forecast_chunk(arrays, start, offset, hourly_blocks):
+    hours = next(iter(arrays.values())).shape[1]
+    stored = 0
+    for row, hourly in enumerate(hourly_blocks, start=offset):
+        # Line each location's hours up with the run's hourly timeline
+        times = np.asarray(hourly.get('time', []), dtype=np.int64)
+        columns = (times - start) // HOUR
+        keep = (columns >= 0) & (columns < hours)
+        for name in forecast_variables:
+            values = np.array([np.nan if value is None else value for value in hourly.get(name, [])],
+                              dtype=np.float32)
+            if len(values) == len(times):
+                arrays[name][row, columns[keep]] = values[keep]
+        stored += 1
+    return stored
+
+# Function to publish a run once every chunk has been tried. A run with
+# nothing stored, e.g. during an Open-Meteo outage, would read as no risk
+# anywhere, so it is deleted and the previous run stays current. Returns the
+# published run, or None.
+def finish_forecast(run, arrays, stored, total):
+    if not stored:
+        discard_run(run)
+        print(f"No forecast stored for any of {total} locations, keeping the current run")
+        return None
+    publish_run(run, arrays)
+    hours = next(iter(arrays.values())).shape[1]
+    print(f"Stored {hours} hours of forecast for {stored} of {total} locations in {run}")
+    return run
+
+# Function to fetch the hourly forecast for every location straight into a
+# new forecast run, and publish it once every chunk has been tried. Each
+# chunk is written into the memory-mapped arrays as it arrives, so memory
+# use does not grow with the number of locations.
+def ingest_forecast(locations, session=None, days=FORECAST_DAYS):
+    session = session or requests.Session()
+    run, arrays, start = begin_forecast(locations, days)
+    chunks = forecast_chunks(locations)
+
+    def fetch(chunk):
+        try:
+            return fetch_forecast_chunk(session, chunk, days)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Forecast fetch for {len(chunk)} locations failed: {e}")
+            return []
+
+    stored = 0
+    with ThreadPoolExecutor(max_workers=FORECAST_WORKERS) as executor:
+        for (offset, _), hourly_blocks in zip(chunks, executor.map(fetch, [chunk for _, chunk in chunks])):
+            stored += store_forecast_chunk(arrays, start, offset, hourly_blocks)
+    return finish_forecast(run, arrays, stored, len(locations))
+
+def main():
+    parser = argparse.ArgumentParser(description="Store the hourly forecast for every tracked location")
+    parser.add_argument('--days', type=int, default=FORECAST_DAYS)
+    parser.add_argument('--grid-step', type=float, default=2, help="Degrees between grid locations")
+    args = parser.parse_args()
+
+    # The airports plus a coarse grid over the continental US
+    locations = list(airport_locations.values()) + grid_locations(24, -125, 50, -66, args.grid_step)
+    ingest_forecast(locations, days=args.days)
+
+if __name__ == "__main__":
+    main()
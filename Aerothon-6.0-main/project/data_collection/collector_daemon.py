@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import os
+import signal
+import sys
+from datetime import datetime
+
+import numpy as np
+import requests
+
+# Shared modules live in the project directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from collect_data import WEATHER_CHUNK_SIZE, airport_locations, current_variables, grid_locations
+from collect_forecast import (begin_forecast, fetch_forecast_chunk, finish_forecast, forecast_chunks,
+                              store_forecast_chunk)
+from flight_ingest import batched, iter_flight_rows
+from flight_sync import fresh_rows
+from storage import close_storage, get_storage, weather_batch_columns
+
+# Open-Meteo endpoint, overridable so the collector can run against a local stub server
+OPEN_METEO_URL = os.environ.get('OPEN_METEO_URL', 'https://api.open-meteo.com/v1/forecast')
+
+# Seconds between collection runs
+WEATHER_INTERVAL = float(os.environ.get('WEATHER_INTERVAL', 900))
+FLIGHT_INTERVAL = float(os.environ.get('FLIGHT_INTERVAL', 300))
+FORECAST_INTERVAL = float(os.environ.get('FORECAST_INTERVAL', 3600))
+# HTTP requests allowed in flight at once, across both APIs
+MAX_IN_FLIGHT = int(os.environ.get('COLLECTOR_MAX_IN_FLIGHT', 4))
+# Batches waiting for the writer before fetchers have to wait
+QUEUE_SIZE = int(os.environ.get('COLLECTOR_QUEUE_SIZE', 16))
+REQUEST_TIMEOUT = 30
+
+# Function to fetch current weather for one chunk of locations as a columnar batch
+def fetch_weather_chunk(session, chunk):
+    params = {
+        "latitude": ",".join(f"{lat:.4f}" for lat, _ in chunk),
+        "longitude": ",".join(f"{lon:.4f}" for _, lon in chunk),
+        "current": ",".join(current_variables),
+        "timeformat": "unixtime",
+    }
+    response = session.get(OPEN_METEO_URL, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    # A single location comes back as an object rather than a list
+    if isinstance(data, dict):
+        data = [data]
+
+    batch = {
+        'time': [],
+        'latitude': np.array([lat for lat, _ in chunk], dtype=np.float64),
+        'longitude': np.array([lon for _, lon in chunk], dtype=np.float64),
+    }
+    for name in current_variables:
+        batch[name] = np.full(len(chunk), np.nan, dtype=np.float32)
+    for row, location in enumerate(data):
+        current = location.get('current', {})
+        batch['time'].append(datetime.fromtimestamp(current['time']) if 'time' in current else None)
+        for name in current_variables:
+            if current.get(name) is not None:
+                batch[name][row] = current[name]
+    return batch
+
+# Join several columnar weather batches into one
+def merge_weather(batches):
+    merged = {'time': [time for batch in batches for time in batch['time']]}
+    for column in weather_batch_columns[1:]:
+        merged[column] = np.concatenate([batch[column] for batch in batches])
+    return merged
+
+def write_batches(kind, batches):
+    storage = get_storage()
+    if kind == 'weather':
+        storage.store_weather(merge_weather(batches))
+    elif kind == 'flights':
+        storage.upsert_flights(row for batch in batches for row in batch)
+    else:
+        storage.save_high_water(max(batches))
+
+class Collector:
+    def __init__(self, locations, weather_interval=WEATHER_INTERVAL, flight_interval=FLIGHT_INTERVAL,
+                 max_in_flight=MAX_IN_FLIGHT, queue_size=QUEUE_SIZE, forecast_interval=FORECAST_INTERVAL):
+        self.locations = locations
+        self.weather_interval = weather_interval
+        self.flight_interval = flight_interval
+        self.forecast_interval = forecast_interval
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=max_in_flight))
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=max_in_flight))
+
+    # Run a blocking HTTP call on a worker thread once a request slot is free
+    async def request(self, call, *args):
+        async with self.slots:
+            return await asyncio.to_thread(call, self.session, *args)
+
+    async def collect_weather(self):
+        chunks = [self.locations[offset:offset + WEATHER_CHUNK_SIZE]
+                  for offset in range(0, len(self.locations), WEATHER_CHUNK_SIZE)]
+
+        async def fetch_and_queue(chunk):
+            try:
+                batch = await self.request(fetch_weather_chunk, chunk)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Weather fetch for {len(chunk)} locations failed: {e}")
+                return
+            # Waits here when the writer is behind, which holds back further fetches
+            await self.queue.put(('weather', batch))
+
+        await asyncio.gather(*(fetch_and_queue(chunk) for chunk in chunks))
+
+    # Walk the flight pages on a worker thread, queueing fixed-size batches of
+    # rows as they are parsed so memory stays flat however many flights exist.
+    # Flights not updated since the last poll are dropped before queueing, and
+    # the new high-water mark is queued behind the last batch.
+    async def collect_flights(self):
+        loop = asyncio.get_running_loop()
+        progress = {}
+
+        def fetch_pages(session):
+            high_water = get_storage().read_high_water()
+            for batch in batched(fresh_rows(iter_flight_rows(session), high_water, progress)):
+                asyncio.run_coroutine_threadsafe(self.queue.put(('flights', batch)), loop).result()
+
+        try:
+            await self.request(fetch_pages)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Flight fetch failed: {e}")
+            return
+        if progress.get('newest') is not None:
+            await self.queue.put(('high_water', progress['newest']))
+
+    # The hourly forecast goes to the local forecast store, not the database,
+    # so it bypasses the writer queue. Each chunk is fetched and stored in a
+    # request slot of its own, like the weather chunks.
+    async def collect_forecast(self):
+        run, arrays, start = await asyncio.to_thread(begin_forecast, self.locations)
+
+        def fetch_and_store(session, offset, chunk):
+            return store_forecast_chunk(arrays, start, offset, fetch_forecast_chunk(session, chunk))
+
+        async def fetch_chunk(offset, chunk):
+            try:
+                return await self.request(fetch_and_store, offset, chunk)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Forecast fetch for {len(chunk)} locations failed: {e}")
+                return 0
+
+        stored = await asyncio.gather(*(fetch_chunk(offset, chunk)
+                                        for offset, chunk in forecast_chunks(self.locations)))
+        await asyncio.to_thread(finish_forecast, run, arrays, sum(stored), len(self.locations))
+
+    # Run a collection job every interval seconds until shutdown. A run that
+    # overruns its interval starts the next one straight away. A run that
+    # fails, e.g. while the database is unreachable, is logged and retried at
+    # the next interval instead of stopping the daemon.
+    async def schedule(self, job, interval, once):
+        loop = asyncio.get_running_loop()
+        while not self.stopping.is_set():
+            started = loop.time()
+            try:
+                await job()
+            except Exception as e:
+                print(f"{job.__name__} run failed: {e!r}")
+            if once:
+                return
+            try:
+                await asyncio.wait_for(self.stopping.wait(), max(0.0, interval - (loop.time() - started)))
+            except asyncio.TimeoutError:
+                pass
+
+    # Write queued batches until told to stop. Whatever is already queued of
+    # the same kind is written together in one storage call.
+    async def writer(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            kind, batch = item
+            batches = [batch]
+            done = False
+            while not self.queue.empty():
+                following = self.queue.get_nowait()
+                if following is None:
+                    done = True
+                    break
+                if following[0] != kind:
+                    await self.write(kind, batches)
+                    kind, batches = following[0], []
+                batches.append(following[1])
+            await self.write(kind, batches)
+            if done:
+                return
+
+    async def write(self, kind, batches):
+        # After a failed flight write the high-water mark stays put, so the
+        # next poll picks those flights up again
+        if kind == 'high_water' and self.flights_failed:
+            self.flights_failed = False
+            return
+        try:
+            await asyncio.to_thread(write_batches, kind, batches)
+        except Exception as e:
+            print(f"Writing {kind} batch failed: {e}")
+            if kind == 'flights':
+                self.flights_failed = True
+
+    def stop(self):
+        print("Shutting down, flushing pending batches")
+        self.stopping.set()
+
+    async def run(self, once=False):
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.stopping = asyncio.Event()
+        self.flights_failed = False
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        await asyncio.to_thread(get_storage().setup)
+        writer = asyncio.create_task(self.writer())
+        # Fetches already under way finish and are queued before the writer is
+        # told to stop, and whatever is queued is written however the schedules end
+        try:
+            await asyncio.gather(
+                self.schedule(self.collect_weather, self.weather_interval, once),
+                self.schedule(self.collect_flights, self.flight_interval, once),
+                self.schedule(self.collect_forecast, self.forecast_interval, once),
+            )
+        finally:
+            await self.queue.put(None)
+            await writer
+        self.session.close()
+        await asyncio.to_thread(close_storage)
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect weather and flight data on a schedule")
+    parser.add_argument('--weather-interval', type=float, default=WEATHER_INTERVAL)
+    parser.add_argument('--flight-interval', type=float, default=FLIGHT_INTERVAL)
+    parser.add_argument('--forecast-interval', type=float, default=FORECAST_INTERVAL)
+    parser.add_argument('--max-in-flight', type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--grid-step', type=float, default=2, help="Degrees between grid locations")
+    parser.add_argument('--once', action='store_true', help="Collect once and exit")
+    args = parser.parse_args()
+
+    # The airports plus a coarse grid over the continental US
+    locations = list(airport_locations.values()) + grid_locations(24, -125, 50, -66, args.grid_step)
+    collector = Collector(locations, args.weather_interval, args.flight_interval, args.max_in_flight,
+                          args.queue_size, args.forecast_interval)
+    asyncio.run(collector.run(once=args.once))
+
+if __name__ == "__main__":
+    main()
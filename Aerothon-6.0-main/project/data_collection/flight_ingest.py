@@ -0,0 +1,98 @@
+import codecs
+import json
+import os
+import re
+import sys
+
+# Shared modules live in the project directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from flight_schema import extract_row
+
+# aviationstack endpoint, overridable so ingestion can run against a local stub server
+AVIATIONSTACK_URL = os.environ.get('AVIATIONSTACK_URL', 'http://api.aviationstack.com/v1/flights')
+AVIATIONSTACK_KEY = os.environ.get('AVIATIONSTACK_KEY', '2dd1322637ebf1467e5f98c94afc4d3c')
+
+# Flights requested per page (100 is the most the free plan allows)
+FLIGHT_PAGE_LIMIT = int(os.environ.get('FLIGHT_PAGE_LIMIT', 100))
+# Upper bound on pages walked in one run, to stay inside the API quota
+MAX_FLIGHT_PAGES = int(os.environ.get('MAX_FLIGHT_PAGES', 1000))
+# Rows handed to the database writer at a time
+FLIGHT_BATCH_ROWS = 1000
+# Bytes read from the response at a time
+READ_CHUNK_BYTES = 64 * 1024
+REQUEST_TIMEOUT = 30
+
+_decoder = json.JSONDecoder()
+
+# Function to yield the elements of the top-level "data" array of a JSON
+# document as it arrives, one decoded element at a time. Only the element
+# being decoded is ever held in memory, never the whole body.
+def iter_json_array(chunks, key='data'):
+    pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = None
+    chunks = iter(chunks)
+    while True:
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += decoder.decode(b'', final=True)
+        else:
+            buffer += decoder.decode(chunk)
+
+        if position is None:
+            match = pattern.search(buffer)
+            if not match:
+                if chunk is None:
+                    return
+                continue
+            position = match.end()
+
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == ']':
+                return
+            try:
+                element, position = _decoder.raw_decode(buffer, position)
+            except ValueError:
+                # The element is cut off by the chunk boundary
+                if chunk is None:
+                    raise
+                break
+            yield element
+
+        buffer = buffer[position:]
+        position = 0
+        if chunk is None:
+            return
+
+# Function to fetch one page of flights and turn it into flight_data rows as
+# the response streams in
+def fetch_flight_page(session, offset, limit=FLIGHT_PAGE_LIMIT):
+    params = {"access_key": AVIATIONSTACK_KEY, "offset": offset, "limit": limit}
+    with session.get(AVIATIONSTACK_URL, params=params, timeout=REQUEST_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        return [extract_row(record) for record in iter_json_array(response.iter_content(READ_CHUNK_BYTES))]
+
+# Function to walk every page of /v1/flights, yielding rows. A page shorter
+# than the limit is the last one.
+def iter_flight_rows(session, limit=FLIGHT_PAGE_LIMIT, max_pages=MAX_FLIGHT_PAGES):
+    for page in range(max_pages):
+        rows = fetch_flight_page(session, page * limit, limit)
+        yield from rows
+        if len(rows) < limit:
+            return
+
+# Group an iterable into lists of at most size items
+def batched(items, size=FLIGHT_BATCH_ROWS):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
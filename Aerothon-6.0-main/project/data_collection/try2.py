@@ -3,6 +3,12 @@ import requests_cache
 from retry_requests import retry
 import psycopg2
 from datetime import datetime
+import os
+import sys
+
+# Shared modules live in the project directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from weather_schema import ensure_weather_schema
 
 # Setup the Open-Meteo API client with cache and retry on error
 cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
@@ -53,26 +59,8 @@ conn = psycopg2.connect(
 )
 cursor = conn.cursor()
 
-# Create table if it does not exist
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS current_weather (
-    id SERIAL PRIMARY KEY,
-    time TIMESTAMP,
-    latitude REAL,
-    longitude REAL,
-    temperature_2m REAL,
-    relative_humidity_2m REAL,
-    precipitation REAL,
-    rain REAL,
-    snowfall REAL,
-    cloud_cover REAL,
-    pressure_msl REAL,
-    surface_pressure REAL,
-    wind_speed_10m REAL,
-    wind_direction_10m REAL,
-    wind_gusts_10m REAL
-)
-''')
+# Create the tables, indexes and latest-observation trigger if they do not exist
+ensure_weather_schema(conn)
 
 # Insert the current weather data
 cursor.execute('''
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+from metrics import span
+
+# Database connection details, overridable from the environment
+db_params = {
+    'dbname': os.environ.get('DB_NAME', 'flight_navigation'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', 'password'),
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': os.environ.get('DB_PORT', '5432')
+}
+
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX', 10))
+# Seconds to wait for a free connection before giving up
+CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+# Connections idle longer than this many seconds are pinged before reuse
+HEALTH_CHECK_AFTER = float(os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', 30))
+
+_pool = None
+_slots = None
+_pool_size = 0
+_last_used = {}
+# id of each checked-out connection -> (pool, slots) it was borrowed from
+_borrowed = {}
+_lock = threading.Lock()
+
+# Must be called with _lock held
+def _create_pool(min_size, max_size):
+    global _pool, _slots, _pool_size
+    _pool = pool.ThreadedConnectionPool(min_size, max_size, **db_params)
+    _slots = threading.BoundedSemaphore(max_size)
+    _pool_size = max_size
+    _last_used.clear()
+
+# Function to create the shared pool explicitly, e.g. at startup to change the
+# size. Any existing pool is closed, connections checked out of it included.
+def init_pool(min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE):
+    with _lock:
+        if _pool is not None:
+            _pool.closeall()
+        _create_pool(min_size, max_size)
+
+# Function to get the current pool and its slots, creating them on first
+# checkout. The check is repeated under the lock so threads making their
+# first checkout together share one pool.
+def _ensure_pool():
+    with _lock:
+        if _pool is None:
+            _create_pool(POOL_MIN_SIZE, POOL_MAX_SIZE)
+        return _pool, _slots, _pool_size
+
+# Function to close every pooled connection. Connections still checked out
+# are closed when they are released.
+def close_pool():
+    global _pool, _slots, _pool_size
+    with _lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+        _slots = None
+        _pool_size = 0
+        _last_used.clear()
+
+def _healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < HEALTH_CHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+# Function to borrow a connection, waiting up to timeout seconds for one to be
+# returned when all are in use. Broken connections are replaced transparently.
+def get_connection(timeout=CHECKOUT_TIMEOUT):
+    current, slots, size = _ensure_pool()
+    if not slots.acquire(timeout=timeout):
+        raise pool.PoolError("No database connection available within %s seconds" % timeout)
+    try:
+        for _ in range(size + 1):
+            conn = current.getconn()
+            if _healthy(conn):
+                _borrowed[id(conn)] = (current, slots)
+                return conn
+            _last_used.pop(id(conn), None)
+            current.putconn(conn, close=True)
+        raise pool.PoolError("Could not get a healthy database connection")
+    except Exception:
+        slots.release()
+        raise
+
+# Function to hand a borrowed connection back. Any open transaction is rolled
+# back by the pool; discard closes the connection instead of reusing it.
+# A connection whose pool was closed or replaced meanwhile is just closed.
+def release_connection(conn, discard=False):
+    owner, slots = _borrowed.pop(id(conn), (None, None))
+    try:
+        if owner is None or owner is not _pool:
+            _last_used.pop(id(conn), None)
+            if not conn.closed:
+                conn.close()
+        elif discard or conn.closed:
+            _last_used.pop(id(conn), None)
+            owner.putconn(conn, close=True)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            owner.putconn(conn)
+    finally:
+        if slots is not None:
+            slots.release()
+
+# Borrow a connection for the duration of a with block
+@contextmanager
+def connection():
+    with span('db_connect'):
+        conn = get_connection()
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    finally:
+        release_connection(conn, discard)
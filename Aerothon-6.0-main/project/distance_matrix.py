@@ -0,0 +1,75 @@
+from itertools import islice
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Number of candidate routes scored per vectorized batch
+SCORE_CHUNK_SIZE = 50000
+
+# Great-circle distance in km between every pair of (lat, lon) points, in one pass
+def pairwise_distances(points):
+    coords = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    lat = coords[:, 0]
+    lon = coords[:, 1]
+    dlat = lat[None, :] - lat[:, None]
+    dlon = lon[None, :] - lon[:, None]
+    a = np.sin(dlat / 2)**2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2)**2
+    a = np.clip(a, 0.0, 1.0)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+# Great-circle distance in km from every point in one set to every point in another
+def cross_distances(points, others):
+    a = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    b = np.radians(np.asarray(others, dtype=np.float64).reshape(-1, 2))
+    dlat = b[None, :, 0] - a[:, None, 0]
+    dlon = b[None, :, 1] - a[:, None, 1]
+    h = np.sin(dlat / 2)**2 + np.cos(a[:, 0])[:, None] * np.cos(b[:, 0])[None, :] * np.sin(dlon / 2)**2
+    h = np.clip(h, 0.0, 1.0)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(h), np.sqrt(1 - h))
+
+# Distance matrix for a route problem. Index 0 is the start, 1..n are the
+# waypoints in the order given and n + 1 is the end.
+def build_route_matrix(start, end, waypoints):
+    return pairwise_distances([start] + list(waypoints) + [end])
+
+# Total great-circle length of a path given as a list of (lat, lon) points
+def path_length(points):
+    coords = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = coords[:-1, 0], coords[:-1, 1]
+    lat2, lon2 = coords[1:, 0], coords[1:, 1]
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    a = np.clip(a, 0.0, 1.0)
+    return float((EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).sum())
+
+# Total length of one route given as a sequence of matrix indices
+def route_length(matrix, indices):
+    indices = np.asarray(indices)
+    return float(matrix[indices[:-1], indices[1:]].sum())
+
+# Lengths of many routes at once. routes is an (m, L) integer array where each
+# row is a route of L matrix indices; returns an array of m lengths.
+def score_routes(matrix, routes):
+    routes = np.asarray(routes, dtype=np.intp)
+    return matrix[routes[:, :-1], routes[:, 1:]].sum(axis=1)
+
+# Wrap waypoint orderings (rows of 0-based waypoint positions) with the start
+# and end indices so they can be passed to score_routes
+def orderings_to_routes(orderings, waypoint_count):
+    orderings = np.array(orderings, dtype=np.intp, ndmin=2)
+    routes = np.empty((len(orderings), waypoint_count + 2), dtype=np.intp)
+    routes[:, 0] = 0
+    routes[:, 1:-1] = orderings + 1
+    routes[:, -1] = waypoint_count + 1
+    return routes
+
+# Score an iterable of waypoint orderings in fixed-size batches, yielding
+# (ordering, length) pairs in the order they were given
+def iter_scored_orderings(matrix, orderings, waypoint_count, chunk_size=SCORE_CHUNK_SIZE):
+    orderings = iter(orderings)
+    while True:
+        chunk = list(islice(orderings, chunk_size))
+        if not chunk:
+            return
+        lengths = score_routes(matrix, orderings_to_routes(chunk, waypoint_count))
+        yield from zip(chunk, lengths.tolist())
@@ -1,16 +1,10 @@
 from itertools import permutations
 from math import radians, sin, cos, sqrt, atan2
+from route_optimizer import find_optimal_routes
+from airport_registry import get_airport_coordinates
 
-# Mock function to convert IATA/ICAO codes to latitude and longitude
-def get_airport_coordinates(code):
-    airport_coords = {
-        'SFO': (37.7749, -122.4194),  # San Francisco
-        'DFW': (32.8998, -97.0403),   # Dallas/Fort Worth
-        'DEN': (39.8561, -104.6737),  # Denver
-        'LAX': (33.9416, -118.4085),  # Los Angeles
-        'ORD': (41.9742, -87.9073)    # Chicago O'Hare
-    }
-    return airport_coords.get(code, (0.0, 0.0))  # Default to (0,0) if not found
+# Enumerating every permutation is only practical for a handful of waypoints
+MAX_BRUTE_FORCE_WAYPOINTS = 7
 
 # Haversine formula to calculate distance between two points on the Earth
 def haversine(coord1, coord2):
@@ -22,7 +16,7 @@ def haversine(coord1, coord2):
     dlat = lat2 - lat1
     dlon = lon2 - lon1
 
-    a = sin(dlat / 2)*2 + cos(lat1) * cos(lat2) * sin(dlon / 2)*2
+    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
     c = 2 * atan2(sqrt(a), sqrt(1 - a))
 
     return R * c
@@ -42,6 +36,10 @@ def find_all_routes(start, end, waypoints):
     
     return sorted(all_routes, key=lambda x: x[1])
 
+# Only the shortest k routes, found without enumerating every permutation
+def find_best_routes(start, end, waypoints, k=1):
+    return find_optimal_routes(start, end, waypoints, k=k)
+
 def main():
     # Sample data from the API
     api_data = {
@@ -75,8 +73,12 @@ def main():
         print("No waypoints entered. Exiting.")
         return
 
-    all_routes = find_all_routes(start, end, waypoints)
-    print("\nAll Possible Routes in Ascending Order of Total Distance:")
+    if len(waypoints) > MAX_BRUTE_FORCE_WAYPOINTS:
+        all_routes = find_best_routes(start, end, waypoints, k=5)
+        print("\nShortest Routes in Ascending Order of Total Distance:")
+    else:
+        all_routes = find_all_routes(start, end, waypoints)
+        print("\nAll Possible Routes in Ascending Order of Total Distance:")
     for route, distance in all_routes:
         print(f"Route: {route} \nTotal Distance: {distance:.2f} km\n")
 
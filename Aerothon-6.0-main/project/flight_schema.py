@@ -0,0 +1,160 @@
+# aviationstack response paths and the flight_data columns they are stored in
+field_mapping = {
+    "flight_date": "flight_date",
+    "flight_status": "flight_status",
+    "departure.airport": "departure_airport",
+    "departure.timezone": "departure_timezone",
+    "departure.iata": "departure_iata",
+    "departure.icao": "departure_icao",
+    "departure.terminal": "departure_terminal",
+    "departure.gate": "departure_gate",
+    "departure.delay": "departure_delay",
+    "departure.scheduled": "departure_scheduled",
+    "departure.estimated": "departure_estimated",
+    "departure.actual": "departure_actual",
+    "departure.estimated_runway": "departure_estimated_runway",
+    "departure.actual_runway": "departure_actual_runway",
+    "arrival.airport": "arrival_airport",
+    "arrival.timezone": "arrival_timezone",
+    "arrival.iata": "arrival_iata",
+    "arrival.icao": "arrival_icao",
+    "arrival.terminal": "arrival_terminal",
+    "arrival.gate": "arrival_gate",
+    "arrival.baggage": "arrival_baggage",
+    "arrival.delay": "arrival_delay",
+    "arrival.scheduled": "arrival_scheduled",
+    "arrival.estimated": "arrival_estimated",
+    "arrival.actual": "arrival_actual",
+    "arrival.estimated_runway": "arrival_estimated_runway",
+    "arrival.actual_runway": "arrival_actual_runway",
+    "airline.name": "airline_name",
+    "airline.iata": "airline_iata",
+    "airline.icao": "airline_icao",
+    "flight.number": "flight_number",
+    "flight.iata": "flight_iata",
+    "flight.icao": "flight_icao",
+    "aircraft.registration": "aircraft_registration",
+    "aircraft.iata": "aircraft_iata",
+    "aircraft.icao": "aircraft_icao",
+    "aircraft.icao24": "aircraft_icao24",
+    "live.updated": "live_updated",
+    "live.latitude": "live_latitude",
+    "live.longitude": "live_longitude",
+    "live.altitude": "live_altitude",
+    "live.direction": "live_direction",
+    "live.speed_horizontal": "live_speed_horizontal",
+    "live.speed_vertical": "live_speed_vertical",
+    "live.is_ground": "live_is_ground"
+}
+
+# Column types that differ from the TEXT default
+column_types = {
+    "flight_date": "DATE",
+    "departure_delay": "INTEGER",
+    "departure_scheduled": "TIMESTAMPTZ",
+    "departure_estimated": "TIMESTAMPTZ",
+    "departure_actual": "TIMESTAMPTZ",
+    "departure_estimated_runway": "TIMESTAMPTZ",
+    "departure_actual_runway": "TIMESTAMPTZ",
+    "arrival_delay": "INTEGER",
+    "arrival_scheduled": "TIMESTAMPTZ",
+    "arrival_estimated": "TIMESTAMPTZ",
+    "arrival_actual": "TIMESTAMPTZ",
+    "arrival_estimated_runway": "TIMESTAMPTZ",
+    "arrival_actual_runway": "TIMESTAMPTZ",
+    "live_updated": "TIMESTAMPTZ",
+    "live_latitude": "DOUBLE PRECISION",
+    "live_longitude": "DOUBLE PRECISION",
+    "live_altitude": "DOUBLE PRECISION",
+    "live_direction": "DOUBLE PRECISION",
+    "live_speed_horizontal": "DOUBLE PRECISION",
+    "live_speed_vertical": "DOUBLE PRECISION",
+    "live_is_ground": "BOOLEAN"
+}
+
+_column_ddl = ",\n    ".join(f"{column} {column_types.get(column, 'TEXT')}" for column in field_mapping.values())
+
+FLIGHT_DATA_DDL = f"""
+CREATE TABLE IF NOT EXISTS flight_data (
+    id SERIAL PRIMARY KEY,
+    {_column_ddl}
+);
+"""
+
+# Columns that identify one flight across polls
+flight_key = ["flight_iata", "flight_date", "departure_scheduled"]
+
+# Keep only the most recently updated copy of each flight, so the natural
+# key index can be built over a table filled by earlier append-only runs
+FLIGHT_DATA_DEDUPE = f"""
+DELETE FROM flight_data older USING flight_data newer
+WHERE {' AND '.join(f'older.{column} = newer.{column}' for column in flight_key)}
+  AND (COALESCE(older.live_updated, '-infinity'), older.id) < (COALESCE(newer.live_updated, '-infinity'), newer.id)
+"""
+
+FLIGHT_KEY_INDEX_DDL = f"""
+CREATE UNIQUE INDEX IF NOT EXISTS flight_data_natural_key ON flight_data ({', '.join(flight_key)})
+"""
+
+# Live position of a flight as read by the traffic index, key first
+live_columns = flight_key + ["live_updated", "live_latitude", "live_longitude", "live_altitude",
+                             "live_direction", "live_speed_horizontal", "live_is_ground"]
+
+# Lets the traffic index read only positions reported since its last refresh
+LIVE_UPDATED_INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS flight_data_live_updated_idx ON flight_data (live_updated)
+"""
+
+# High-water marks of incremental syncs, one row per feed
+INGEST_STATE_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_state (
+    name TEXT PRIMARY KEY,
+    high_water TIMESTAMPTZ
+);
+"""
+
+# Function to create the flight_data table, its natural key and live_updated
+# indexes and the sync state table if missing
+def ensure_flight_schema(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(FLIGHT_DATA_DDL)
+        cursor.execute(INGEST_STATE_DDL)
+        cursor.execute(LIVE_UPDATED_INDEX_DDL)
+        cursor.execute("SELECT to_regclass('flight_data_natural_key')")
+        if cursor.fetchone()[0] is None:
+            cursor.execute(FLIGHT_DATA_DEDUPE)
+            cursor.execute(FLIGHT_KEY_INDEX_DDL)
+    conn.commit()
+
+_empty = {}
+
+# Function to compile an extractor for a mapping of dotted paths. The
+# generated function reads every path with plain dict lookups, looking each
+# parent object up once, and returns the values as a tuple in mapping order.
+# A missing or non-dict parent yields None for everything below it.
+def compile_extractor(mapping):
+    lines = ["def extract(record):"]
+    names = {(): "record"}
+    values = []
+    for path in mapping:
+        keys = tuple(path.split('.'))
+        for depth in range(1, len(keys)):
+            prefix = keys[:depth]
+            if prefix not in names:
+                names[prefix] = f"v{len(names)}"
+                lines.append(f"    {names[prefix]} = {names[prefix[:-1]]}.get({prefix[-1]!r})")
+                lines.append(f"    if not isinstance({names[prefix]}, dict): {names[prefix]} = _empty")
+        values.append(f"{names[keys[:-1]]}.get({keys[-1]!r})")
+    lines.append(f"    return ({', '.join(values)},)")
+    namespace = {'_empty': _empty}
+    exec(compile('\n'.join(lines), '<flight extractor>', 'exec'), namespace)
+    return namespace['extract']
+
+# Turns one nested aviationstack record into a flight_data row tuple
+extract_row = compile_extractor(field_mapping)
+
+# Function to turn aviationstack flight records into flight_data rows, in
+# the column order of field_mapping
+def flight_rows(records):
+    for record in records:
+        yield extract_row(record)
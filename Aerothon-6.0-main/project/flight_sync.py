@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+from bulk_loader import COPY_CHUNK_ROWS, copy_rows
+from flight_schema import field_mapping, flight_key
+
+# Name of the aviationstack feed in ingest_state
+FLIGHT_FEED = 'aviationstack_flights'
+# Reports can reach the API a little after their live.updated time, so rows
+# this close to the high-water mark are synced again. The upsert makes that harmless.
+HIGH_WATER_OVERLAP = timedelta(minutes=10)
+
+flight_columns = list(field_mapping.values())
+_updated_index = flight_columns.index('live_updated')
+_key_indexes = [flight_columns.index(column) for column in flight_key]
+_changing_columns = [column for column in flight_columns if column not in flight_key]
+
+STAGING_DDL = f"""
+CREATE TEMP TABLE IF NOT EXISTS flight_staging AS
+SELECT {', '.join(flight_columns)} FROM flight_data WITH NO DATA;
+TRUNCATE flight_staging;
+"""
+
+# Upsert the staged rows on the natural key. The newest copy of a flight in
+# the batch wins, rows that are identical to the stored ones are left
+# untouched, and a report older than the stored one never overwrites it.
+UPSERT_SQL = f"""
+INSERT INTO flight_data ({', '.join(flight_columns)})
+SELECT DISTINCT ON ({', '.join(flight_key)}) {', '.join(flight_columns)}
+FROM flight_staging
+WHERE {' AND '.join(f'{column} IS NOT NULL' for column in flight_key)}
+ORDER BY {', '.join(flight_key)}, live_updated DESC NULLS LAST
+ON CONFLICT ({', '.join(flight_key)}) DO UPDATE SET
+    {', '.join(f'{column} = EXCLUDED.{column}' for column in _changing_columns)}
+WHERE ({', '.join(f'flight_data.{column}' for column in _changing_columns)})
+      IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in _changing_columns)})
+  AND (flight_data.live_updated IS NULL OR EXCLUDED.live_updated IS NULL
+       OR EXCLUDED.live_updated >= flight_data.live_updated)
+RETURNING xmax = 0
+"""
+
+def parse_time(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+# Function to read the live.updated high-water mark left by the last sync
+def read_high_water(conn, feed=FLIGHT_FEED):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT high_water FROM ingest_state WHERE name = %s", (feed,))
+        row = cursor.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+# Function to move the high-water mark forward. It never moves back.
+def save_high_water(conn, high_water, feed=FLIGHT_FEED):
+    if high_water is None:
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("""
+        INSERT INTO ingest_state (name, high_water) VALUES (%s, %s)
+        ON CONFLICT (name) DO UPDATE SET high_water = GREATEST(ingest_state.high_water, EXCLUDED.high_water)
+        """, (feed, high_water))
+    conn.commit()
+
+# Function to drop rows whose live.updated is older than the high-water mark
+# less the overlap. Rows without live data always pass, since their status
+# can still change. The newest live.updated seen and the number of rows
+# skipped are kept in progress.
+def fresh_rows(rows, high_water, progress):
+    cutoff = high_water - HIGH_WATER_OVERLAP if high_water else None
+    progress.setdefault('newest', high_water)
+    progress.setdefault('skipped', 0)
+    for row in rows:
+        updated = parse_time(row[_updated_index])
+        if updated is not None:
+            if cutoff is not None and updated <= cutoff:
+                progress['skipped'] += 1
+                continue
+            if progress['newest'] is None or updated > progress['newest']:
+                progress['newest'] = updated
+        yield row
+
+# Function to upsert flight rows on the natural key. Rows are staged with
+# COPY first, then merged in one statement. Rows missing part of the key
+# cannot be matched and are dropped. Returns (inserted, updated).
+def upsert_flights(conn, rows, chunk_rows=COPY_CHUNK_ROWS):
+    with conn.cursor() as cursor:
+        cursor.execute(STAGING_DDL)
+    copy_rows(conn, 'flight_staging', flight_columns, rows, chunk_rows)
+    with conn.cursor() as cursor:
+        cursor.execute(UPSERT_SQL)
+        results = [row[0] for row in cursor.fetchall()]
+        cursor.execute("TRUNCATE flight_staging")
+    conn.commit()
+    inserted = sum(results)
+    return inserted, len(results) - inserted
@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+import risk_engine
+from distance_matrix import cross_distances
+
+# Forecast runs live in numbered directories under here. CURRENT names the
+# run readers should use and is only switched once a run is complete.
+FORECAST_DIR = os.environ.get(
+    'FORECAST_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'forecast'))
+# Hourly variables stored per run, one (locations, hours) float32 array each
+forecast_variables = [
+    "temperature_2m", "relative_humidity_2m", "precipitation", "rain", "snowfall", "cloud_cover",
+    "pressure_msl", "surface_pressure", "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m"
+]
+HOUR = 3600
+# Finished runs kept on disk, so readers of the previous run are not cut off
+RUNS_KEPT = 2
+# Seconds between checks for a newer run
+RELOAD_CHECK_SECONDS = 30
+# Each run stores the nearest location for every cell of a raster this fine,
+# in degrees, covering the locations plus a margin
+RASTER_DEGREES = 0.25
+RASTER_MARGIN_DEGREES = 1.0
+# Raster cells whose nearest location is computed at once
+RASTER_CHUNK_CELLS = 4096
+
+_store = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+# Function to build the nearest-location raster over a set of locations, so
+# readers find the location for a point with one array read
+def build_nearest_raster(locations):
+    south, west = locations.min(axis=0) - RASTER_MARGIN_DEGREES
+    north, east = locations.max(axis=0) + RASTER_MARGIN_DEGREES
+    rows = int(np.ceil((north - south) / RASTER_DEGREES))
+    cols = int(np.ceil((east - west) / RASTER_DEGREES))
+    lat_centres = south + (np.arange(rows) + 0.5) * RASTER_DEGREES
+    lon_centres = west + (np.arange(cols) + 0.5) * RASTER_DEGREES
+    centres = np.stack(np.meshgrid(lat_centres, lon_centres, indexing='ij'), axis=-1).reshape(-1, 2)
+    nearest = np.empty(len(centres), dtype=np.int32)
+    for offset in range(0, len(centres), RASTER_CHUNK_CELLS):
+        chunk = centres[offset:offset + RASTER_CHUNK_CELLS]
+        nearest[offset:offset + len(chunk)] = cross_distances(chunk, locations).argmin(axis=1)
+    raster = {"south": float(south), "west": float(west), "step": RASTER_DEGREES, "rows": rows, "cols": cols}
+    return nearest.reshape(rows, cols), raster
+
+# Function to start a new run: creates the run directory and a
+# memory-mapped array per variable, filled with NaN. Returns the run
+# directory and a dict of the arrays to fill in.
+def create_run(locations, start, hours, variables=forecast_variables):
+    run = os.path.join(FORECAST_DIR, f"run-{int(time.time() * 1000)}")
+    os.makedirs(run)
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    np.save(os.path.join(run, 'locations.npy'), locations)
+    nearest, raster = build_nearest_raster(locations)
+    np.save(os.path.join(run, 'nearest.npy'), nearest)
+    arrays = {}
+    for name in variables:
+        arrays[name] = np.lib.format.open_memmap(
+            os.path.join(run, f'{name}.npy'), mode='w+', dtype=np.float32, shape=(len(locations), hours))
+        arrays[name][:] = np.nan
+    with open(os.path.join(run, 'meta.json'), 'w') as f:
+        json.dump({"start": int(start), "step": HOUR, "hours": hours, "variables": list(variables), "raster": raster}, f)
+    return run, arrays
+
+# Function to make a finished run the current one and prune old runs
+def publish_run(run, arrays):
+    for array in arrays.values():
+        array.flush()
+    pointer = os.path.join(FORECAST_DIR, 'CURRENT')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(os.path.basename(run))
+    os.replace(pointer + '.tmp', pointer)
+    runs = sorted(name for name in os.listdir(FORECAST_DIR) if name.startswith('run-'))
+    for name in runs[:-RUNS_KEPT]:
+        shutil.rmtree(os.path.join(FORECAST_DIR, name), ignore_errors=True)
+
+# Function to delete a run that will not be published
+def discard_run(run):
+    shutil.rmtree(run, ignore_errors=True)
+
+def _load_current():
+    with open(os.path.join(FORECAST_DIR, 'CURRENT')) as f:
+        run = os.path.join(FORECAST_DIR, f.read().strip())
+    with open(os.path.join(run, 'meta.json')) as f:
+        meta = json.load(f)
+    return {
+        'run': run,
+        'meta': meta,
+        'locations': np.load(os.path.join(run, 'locations.npy'), mmap_mode='r'),
+        'nearest': np.load(os.path.join(run, 'nearest.npy'), mmap_mode='r'),
+        'arrays': {name: np.load(os.path.join(run, f'{name}.npy'), mmap_mode='r') for name in meta['variables']},
+    }
+
+# Function to get the current run, memory mapped. Picks up a newer run at
+# most every RELOAD_CHECK_SECONDS. Returns None until a run is published.
+def open_store():
+    global _store, _checked_at
+    now = time.monotonic()
+    if _store is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _store
+    with _lock:
+        _checked_at = now
+        try:
+            with open(os.path.join(FORECAST_DIR, 'CURRENT')) as f:
+                current = os.path.join(FORECAST_DIR, f.read().strip())
+            if _store is None or _store['run'] != current:
+                _store = _load_current()
+        except OSError:
+            pass
+        return _store
+
+# Rows of the stored locations nearest to many points, or -1 for points
+# off the raster, i.e. more than the margin away from every location
+def nearest_locations(store, latitudes, longitudes):
+    raster = store['meta']['raster']
+    row = np.floor((np.asarray(latitudes, dtype=np.float64) - raster['south']) / raster['step']).astype(np.int64)
+    col = np.floor((np.asarray(longitudes, dtype=np.float64) - raster['west']) / raster['step']).astype(np.int64)
+    on_raster = (row >= 0) & (row < raster['rows']) & (col >= 0) & (col < raster['cols'])
+    rows = np.full(len(row), -1, dtype=np.int64)
+    rows[on_raster] = store['nearest'][row[on_raster], col[on_raster]]
+    return rows
+
+# Forecast values at many (latitude, longitude, unix time) triples as a
+# (points, variables) array. Times are rounded to the nearest hour. Points
+# outside the forecast window or far from every location are NaN.
+def forecast_values(latitudes, longitudes, times, names=forecast_variables):
+    store = open_store()
+    result = np.full((len(latitudes), len(names)), np.nan)
+    if store is None:
+        return result
+    meta = store['meta']
+    hours = np.rint((np.asarray(times, dtype=np.float64) - meta['start']) / meta['step']).astype(np.int64)
+    rows = nearest_locations(store, latitudes, longitudes)
+    found = (hours >= 0) & (hours < meta['hours']) & (rows >= 0)
+    for column, name in enumerate(names):
+        array = store['arrays'].get(name)
+        if array is not None:
+            result[found, column] = array[rows[found], hours[found]]
+    return result
+
+# Forecast weather dict at one point and unix time, or None outside the window
+def forecast_at(latitude, longitude, when):
+    values = forecast_values([latitude], [longitude], [when])[0]
+    if np.isnan(values).all():
+        return None
+    return {name: None if np.isnan(value) else float(value) for name, value in zip(forecast_variables, values)}
+
+# Normalised risk (0..1) at many points and ETAs, scored by the risk engine
+def forecast_risk(latitudes, longitudes, times):
+    return risk_engine.normalized_risk(forecast_values(latitudes, longitudes, times), forecast_variables)
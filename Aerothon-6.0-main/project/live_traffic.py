@@ -0,0 +1,290 @@
+import itertools
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from distance_matrix import EARTH_RADIUS_KM
+from flight_schema import flight_key
+from flight_sync import HIGH_WATER_OVERLAP, parse_time
+from storage import get_storage
+
+# Minimum en-route separation: 5 NM laterally, 1000 ft vertically
+SEPARATION_KM = 9.26
+SEPARATION_FT = 1000
+# aviationstack reports altitude in metres
+FEET_PER_METRE = 3.28084
+# Edge of a hash cell, in km, and height of an altitude band, in feet
+TRAFFIC_CELL_KM = 10.0
+TRAFFIC_BAND_FT = 1000
+# Smallest cells the conflict scan hashes into, however tight the limits, so
+# the cell numbers of the whole globe fit in 64 bits
+MIN_PAIR_CELL_KM = 1.0
+MIN_PAIR_BAND_FT = 100
+# Largest limits a traffic query accepts. Wider ones would pair up most of
+# the sky in the conflict scan.
+MAX_SEARCH_KM = 100
+MAX_SEARCH_FT = 10000
+# Positions not reported for this long are dropped
+TRAFFIC_MAX_AGE = timedelta(minutes=float(os.environ.get('TRAFFIC_MAX_AGE_MINUTES', 15)))
+# Seconds between reads of newly reported positions from storage
+TRAFFIC_REFRESH_SECONDS = 30
+
+# One flight's last reported position. key is the flight's natural key.
+Position = namedtuple('Position', ['key', 'latitude', 'longitude', 'altitude', 'direction', 'speed', 'updated'])
+
+_key_length = len(flight_key)
+
+# Points on the Earth's surface as (x, y, z) in km. Straight-line distance
+# between two points is never more than the great-circle one, so a grid over
+# these coordinates finds everything within a radius without special cases
+# at the poles or the antimeridian.
+def to_xyz(latitudes, longitudes):
+    lat = np.radians(latitudes)
+    lon = np.radians(longitudes)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1) * EARTH_RADIUS_KM
+
+# to_xyz of one position, with its altitude in feet, without NumPy's per-call overhead
+def _point(latitude, longitude, altitude):
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (EARTH_RADIUS_KM * math.cos(lat) * math.cos(lon), EARTH_RADIUS_KM * math.cos(lat) * math.sin(lon),
+            EARTH_RADIUS_KM * math.sin(lat), (altitude or 0.0) * FEET_PER_METRE)
+
+# Great-circle distance in km for straight-line distances in km
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / (2 * EARTH_RADIUS_KM), 1.0))
+
+# Every pair of points closer than radius_km along the surface and less than
+# vertical_ft apart in altitude, as index arrays (i, j) holding each pair
+# once. The points are hashed into cells at least as large as the limits, so
+# each point is only compared with the 41 cells (its own and half of its 80
+# neighbours) that can hold a partner.
+def close_pairs(xyz, altitudes_ft, radius_km, vertical_ft):
+    count = len(xyz)
+    if count < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    cell_km = max(radius_km, MIN_PAIR_CELL_KM)
+    band_ft = max(vertical_ft, MIN_PAIR_BAND_FT)
+    while True:
+        grid = np.column_stack([np.floor(xyz / cell_km), np.floor(altitudes_ft / band_ft)]).astype(np.int64)
+        # One spare cell on every side keeps neighbour codes inside the grid
+        grid -= grid.min(axis=0) - 1
+        dims = tuple(grid.max(axis=0) + 2)
+        if math.prod(dims) < 2 ** 62:
+            break
+        # Only reachable with absurd altitudes; larger cells are still correct
+        cell_km *= 2
+        band_ft *= 2
+    codes = np.ravel_multi_index(grid.T, dims)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+
+    firsts, seconds = [], []
+    for offset in itertools.product((-1, 0, 1), repeat=4):
+        if offset < (0, 0, 0, 0):
+            continue
+        # Searching in code order keeps the binary searches cache friendly
+        delta = np.ravel_multi_index(np.array(offset) + 1, dims) - np.ravel_multi_index((1, 1, 1, 1), dims)
+        neighbours = sorted_codes + delta
+        starts = np.searchsorted(sorted_codes, neighbours, side='left')
+        counts = np.searchsorted(sorted_codes, neighbours, side='right') - starts
+        total = int(counts.sum())
+        if not total:
+            continue
+        first = np.repeat(order, counts)
+        second = order[np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)]
+        if offset == (0, 0, 0, 0):
+            keep = first < second
+            first, second = first[keep], second[keep]
+        firsts.append(first)
+        seconds.append(second)
+    if not firsts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    first = np.concatenate(firsts)
+    second = np.concatenate(seconds)
+    distance = chord_to_km(np.linalg.norm(xyz[first] - xyz[second], axis=1))
+    close = (distance < radius_km) & (np.abs(altitudes_ft[first] - altitudes_ft[second]) < vertical_ft)
+    return first[close], second[close]
+
+# In-memory index of airborne flights, hashed by position and altitude band.
+# Flights move between cells as new positions arrive, so keeping it current
+# costs one dict update per report.
+class TrafficIndex:
+    def __init__(self, cell_km=TRAFFIC_CELL_KM, band_ft=TRAFFIC_BAND_FT, max_age=TRAFFIC_MAX_AGE):
+        self.cell_km = cell_km
+        self.band_ft = band_ft
+        self.max_age = max_age
+        self.positions = {}
+        # key -> (x, y, z, altitude in feet)
+        self.points = {}
+        # (cx, cy, cz, band) -> set of keys
+        self.cells = {}
+        self.cell_of = {}
+        # flight IATA code -> key of its latest flight
+        self.by_flight = {}
+        # Newest report seen, where the next refresh from storage starts
+        self.high_water = None
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _cell(self, point):
+        return (math.floor(point[0] / self.cell_km), math.floor(point[1] / self.cell_km),
+                math.floor(point[2] / self.cell_km), math.floor(point[3] / self.band_ft))
+
+    # Function to record a flight's position, moving it to its new cell.
+    # Reports older than the stored one are ignored. Returns whether the
+    # position was taken.
+    def update(self, key, latitude, longitude, altitude=None, direction=None, speed=None, updated=None):
+        updated = parse_time(updated)
+        with self.lock:
+            old = self.positions.get(key)
+            if old is not None and updated is not None and old.updated is not None and updated < old.updated:
+                return False
+            point = _point(latitude, longitude, altitude)
+            cell = self._cell(point)
+            previous = self.cell_of.get(key)
+            if previous != cell:
+                if previous is not None:
+                    self._leave(key, previous)
+                self.cells.setdefault(cell, set()).add(key)
+                self.cell_of[key] = cell
+            self.positions[key] = Position(key, latitude, longitude, altitude, direction, speed, updated)
+            self.points[key] = point
+            self.by_flight[key[0]] = key
+            if updated is not None and (self.high_water is None or updated > self.high_water):
+                self.high_water = updated
+            return True
+
+    def _leave(self, key, cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self.cells[cell]
+
+    def remove(self, key):
+        with self.lock:
+            if self.positions.pop(key, None) is None:
+                return False
+            self.points.pop(key)
+            self._leave(key, self.cell_of.pop(key))
+            if self.by_flight.get(key[0]) == key:
+                del self.by_flight[key[0]]
+            return True
+
+    # Function to drop flights whose last report is older than max_age.
+    # Returns how many were dropped.
+    def expire(self, now=None):
+        cutoff = (now or datetime.now(timezone.utc)) - self.max_age
+        with self.lock:
+            stale = [key for key, position in self.positions.items()
+                     if position.updated is None or position.updated < cutoff]
+            for key in stale:
+                self.remove(key)
+        return len(stale)
+
+    # Function to apply rows in flight_schema.live_columns order, e.g. one
+    # poll's worth. Flights on the ground leave the index. Returns the number
+    # of positions taken.
+    def update_rows(self, rows):
+        taken = 0
+        with self.lock:
+            for row in rows:
+                key = tuple(row[:_key_length])
+                updated, latitude, longitude, altitude, direction, speed, on_ground = row[_key_length:]
+                if None in key or latitude is None or longitude is None:
+                    continue
+                if on_ground:
+                    self.remove(key)
+                    continue
+                taken += self.update(key, float(latitude), float(longitude), altitude, direction, speed, updated)
+        return taken
+
+    # Flights closer than radius_km along the surface and less than
+    # vertical_ft in altitude from a point, nearest first, as (Position,
+    # distance_km, vertical_ft). The same limits as conflicts.
+    def nearby_point(self, latitude, longitude, altitude=None, radius_km=SEPARATION_KM,
+                     vertical_ft=SEPARATION_FT, exclude=None):
+        x, y, z, altitude_ft = _point(latitude, longitude, altitude)
+        low = self._cell((x - radius_km, y - radius_km, z - radius_km, altitude_ft - vertical_ft))
+        high = self._cell((x + radius_km, y + radius_km, z + radius_km, altitude_ft + vertical_ft))
+        with self.lock:
+            spans = [range(a, b + 1) for a, b in zip(low, high)]
+            if math.prod(len(span) for span in spans) > len(self.cells):
+                # A wide search touches fewer keys by walking the occupied cells
+                candidates = [key for cell, members in self.cells.items()
+                              if all(a <= c <= b for a, c, b in zip(low, cell, high)) for key in members]
+            else:
+                candidates = [key for cell in itertools.product(*spans) for key in self.cells.get(cell, ())]
+            found = []
+            for key in candidates:
+                if key == exclude:
+                    continue
+                px, py, pz, palt = self.points[key]
+                vertical = abs(palt - altitude_ft)
+                if vertical >= vertical_ft:
+                    continue
+                chord = math.sqrt((px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2)
+                distance = 2 * EARTH_RADIUS_KM * math.asin(min(chord / (2 * EARTH_RADIUS_KM), 1.0))
+                if distance < radius_km:
+                    found.append((self.positions[key], distance, vertical))
+        found.sort(key=lambda item: item[1])
+        return found
+
+    # Flights near one flight, found by natural key or by IATA flight code
+    def nearby(self, flight, radius_km=SEPARATION_KM, vertical_ft=SEPARATION_FT):
+        with self.lock:
+            key = flight if isinstance(flight, tuple) else self.by_flight.get(flight)
+            position = self.positions.get(key)
+            if position is None:
+                return None
+            return self.nearby_point(position.latitude, position.longitude, position.altitude,
+                                     radius_km, vertical_ft, exclude=key)
+
+    # Every pair of flights closer than radius_km and vertical_ft, as
+    # (Position, Position, distance_km, vertical_ft), closest first
+    def conflicts(self, radius_km=SEPARATION_KM, vertical_ft=SEPARATION_FT):
+        with self.lock:
+            keys = list(self.points)
+            points = np.array([self.points[key] for key in keys], dtype=np.float64).reshape(-1, 4)
+            positions = [self.positions[key] for key in keys]
+        first, second = close_pairs(points[:, :3], points[:, 3], radius_km, vertical_ft)
+        distance = chord_to_km(np.linalg.norm(points[first, :3] - points[second, :3], axis=1))
+        vertical = np.abs(points[first, 3] - points[second, 3])
+        order = np.argsort(distance, kind='stable')
+        return [(positions[first[i]], positions[second[i]], float(distance[i]), float(vertical[i]))
+                for i in order.tolist()]
+
+_index = None
+_refreshed_at = 0.0
+_lock = threading.Lock()
+
+# Function to get the shared traffic index, bringing it up to date with the
+# positions stored since its last refresh at most every TRAFFIC_REFRESH_SECONDS
+def get_traffic_index():
+    global _index, _refreshed_at
+    now = time.monotonic()
+    if _index is not None and now - _refreshed_at < TRAFFIC_REFRESH_SECONDS:
+        return _index
+    with _lock:
+        if _index is not None and now - _refreshed_at < TRAFFIC_REFRESH_SECONDS:
+            return _index
+        index = _index or TrafficIndex()
+        # Reports can be stored a little after their live.updated time, so
+        # the last few minutes are read again; older reports are ignored
+        if index.high_water is None:
+            since = datetime.now(timezone.utc) - index.max_age
+        else:
+            since = index.high_water - HIGH_WATER_OVERLAP
+        index.update_rows(get_storage().live_positions(since))
+        index.expire()
+        _index = index
+        _refreshed_at = now
+        return _index
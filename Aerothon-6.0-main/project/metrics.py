@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Set METRICS_ENABLED=0 to turn every span into a no-op
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_lock = threading.Lock()
+# Every metric, in the order it is rendered
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+# A monotonically increasing count per label combination
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with _lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_label_text(self.labels, label_values)} {value}')
+        return lines
+
+# Observations counted into fixed buckets per label combination. Each series
+# is a list of per-bucket counts (the last one past every bound) and a sum.
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with _lock:
+            series = [(label_values, list(counts), total) for label_values, (counts, total) in self.series.items()]
+        for label_values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _label_text(self.labels, label_values, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _label_text(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+stage_seconds = Histogram('aerothon_stage_duration_seconds', 'Time spent in one stage of handling a request',
+                          ['stage'])
+stage_errors = Counter('aerothon_stage_errors_total', 'Stages that ended with an exception', ['stage'])
+request_seconds = Histogram('aerothon_http_request_duration_seconds', 'Time to handle an HTTP request',
+                            ['app', 'method', 'endpoint', 'status'])
+requests_total = Counter('aerothon_http_requests_total', 'HTTP requests handled',
+                         ['app', 'method', 'endpoint', 'status'])
+
+# Time the body of a with block as one stage: db_connect, db_query,
+# open_meteo, route_search, risk_scoring or traffic_search. Stages may nest.
+# A plain class rather than a generator-based context manager, as it is on
+# every hot path.
+class span:
+    __slots__ = ('stage', 'began')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+
+    def __exit__(self, kind, error, traceback):
+        if METRICS_ENABLED:
+            stage_seconds.observe(time.perf_counter() - self.began, self.stage)
+            if kind is not None and issubclass(kind, Exception):
+                stage_errors.inc(self.stage)
+        return False
+
+# Every metric in the Prometheus text format
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# Function to time every request of a Flask app, labelled by endpoint rather
+# than path so the number of series stays bounded, and to serve /metrics
+def instrument_app(app, name):
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if METRICS_ENABLED and started is not None and request.endpoint != 'metrics':
+            labels = (name, request.method, request.endpoint or 'unmatched', str(response.status_code))
+            request_seconds.observe(time.perf_counter() - started, *labels)
+            requests_total.inc(*labels)
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', lambda: Response(render(), content_type=CONTENT_TYPE))
@@ -0,0 +1,133 @@
+import heapq
+from array import array
+
+import numpy as np
+
+from distance_matrix import EARTH_RADIUS_KM, path_length
+from route_risk import DEFAULT_RISK_WEIGHT, lookup_risk
+
+# Grid cell size in degrees, and the range a request may pick from. Weather
+# is cached on weather_cache's 0.1 degree grid, so finer cells would add cost
+# without adding detail.
+DEFAULT_CELL_DEGREES = 0.5
+MIN_CELL_DEGREES = 0.1
+MAX_CELL_DEGREES = 5.0
+# Largest raster a single plan may score and search
+MAX_GRID_CELLS = 40000
+# Space left around the departure/arrival bounding box, in degrees
+DEFAULT_MARGIN_DEGREES = 5.0
+
+# The eight neighbouring moves as (row step, column step)
+MOVES = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+def _haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    a = np.clip(a, 0.0, 1.0)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+# Longitudes folded into -180..180
+def wrap_longitude(lon):
+    return (np.asarray(lon, dtype=np.float64) + 180.0) % 360.0 - 180.0
+
+# A longitude moved by whole turns into the grid's range, which starts at
+# lons[0] and may run past 180 for routes across the antimeridian
+def _grid_longitude(lons, lon):
+    return float(lons[0] + (lon - lons[0]) % 360.0)
+
+# Latitude and longitude of the cell centres covering both airports plus a
+# margin. The box goes the short way round, so a route across the
+# antimeridian gets longitudes running continuously past 180.
+def build_grid(start, end, cell_degrees=DEFAULT_CELL_DEGREES, margin_degrees=DEFAULT_MARGIN_DEGREES):
+    if not cell_degrees > 0:
+        raise ValueError(f"cell_degrees must be positive, got {cell_degrees}")
+    south = max(min(start[0], end[0]) - margin_degrees, -89.0)
+    north = min(max(start[0], end[0]) + margin_degrees, 89.0)
+    lon1, lon2 = float(wrap_longitude(start[1])), float(wrap_longitude(end[1]))
+    if abs(lon2 - lon1) > 180:
+        if lon1 < lon2:
+            lon1 += 360.0
+        else:
+            lon2 += 360.0
+    west = min(lon1, lon2) - margin_degrees
+    east = max(lon1, lon2) + margin_degrees
+    lats = np.arange(south, north + cell_degrees / 2, cell_degrees)
+    lons = np.arange(west, east + cell_degrees / 2, cell_degrees)
+    return lats, lons
+
+# Normalised weather risk for every cell centre, fetched and scored in one batch
+def build_risk_raster(lats, lons, thresholds=None, lookup=lookup_risk):
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+    points = np.stack([lat_grid.ravel(), wrap_longitude(lon_grid.ravel())], axis=1)
+    return np.asarray(lookup(points, thresholds), dtype=np.float32).reshape(len(lats), len(lons))
+
+def _nearest_cell(axis, value):
+    return int(np.abs(axis - value).argmin())
+
+# Lowest-cost path between two points across a risk raster using A* with a
+# great-circle heuristic. Each move costs its length scaled up by the mean
+# risk of the two cells, so the heuristic never overestimates. Every cell is
+# expanded at most once, and the raster is bounded by MAX_GRID_CELLS, so the
+# search needs no separate budget. Returns (path, distance_km, cost), or None
+# if the end cannot be reached.
+def plan_path(start, end, lats, lons, risk, risk_weight=DEFAULT_RISK_WEIGHT):
+    rows, cols = len(lats), len(lons)
+    size = rows * cols
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+
+    goal_row, goal_col = _nearest_cell(lats, end[0]), _nearest_cell(lons, _grid_longitude(lons, end[1]))
+    source = _nearest_cell(lats, start[0]) * cols + _nearest_cell(lons, _grid_longitude(lons, start[1]))
+    goal = goal_row * cols + goal_col
+
+    # Flat, typed buffers keep per-cell state compact and cheap to index
+    heuristic = array('d', _haversine(lat_grid, lon_grid, lats[goal_row], lons[goal_col]).ravel().tolist())
+    cell_risk = array('d', np.asarray(risk, dtype=np.float64).ravel().tolist())
+    cost = array('d', [float('inf')]) * size
+    parent = array('l', [-1]) * size
+    closed = bytearray(size)
+
+    # Move lengths only depend on the row and direction
+    step = np.zeros((rows, len(MOVES)))
+    for d, (dr, dc) in enumerate(MOVES):
+        target = np.clip(np.arange(rows) + dr, 0, rows - 1)
+        step[:, d] = _haversine(lats, 0.0, lats[target], dc * (lons[1] - lons[0] if cols > 1 else 0.0))
+    step = step.tolist()
+
+    cost[source] = 0.0
+    frontier = [(heuristic[source], source)]
+
+    while frontier:
+        _, cell = heapq.heappop(frontier)
+        if closed[cell]:
+            continue
+        if cell == goal:
+            break
+        closed[cell] = 1
+        row, col = divmod(cell, cols)
+        base = cost[cell]
+        here = cell_risk[cell]
+        lengths = step[row]
+        for d, (dr, dc) in enumerate(MOVES):
+            r, c = row + dr, col + dc
+            if r < 0 or r >= rows or c < 0 or c >= cols:
+                continue
+            nxt = r * cols + c
+            if closed[nxt]:
+                continue
+            candidate = base + lengths[d] * (1 + risk_weight * (here + cell_risk[nxt]) / 2)
+            if candidate < cost[nxt]:
+                cost[nxt] = candidate
+                parent[nxt] = cell
+                heapq.heappush(frontier, (candidate + heuristic[nxt], nxt))
+    else:
+        return None
+
+    cells = []
+    cell = goal
+    while cell != -1:
+        cells.append(cell)
+        cell = parent[cell]
+    cells.reverse()
+    path = ([tuple(start)] + [(float(lats[c // cols]), float(wrap_longitude(lons[c % cols]))) for c in cells[1:-1]]
+            + [tuple(end)])
+    return path, path_length(path), cost[goal]
@@ -0,0 +1,73 @@
+from bulk_loader import COPY_CHUNK_ROWS, copy_columns
+from db_pool import close_pool, connection
+from flight_schema import ensure_flight_schema, live_columns
+from flight_sync import FLIGHT_FEED, read_high_water, save_high_water, upsert_flights
+from metrics import span
+from storage import Storage, weather_batch_columns
+from weather_schema import ensure_weather_schema, weather_columns
+
+LATEST_WEATHER_QUERY = f"""
+SELECT latitude, longitude, {', '.join(weather_columns)}
+FROM latest_weather
+WHERE grid_cell = ANY(%s)
+"""
+
+LIVE_POSITIONS_QUERY = f"""
+SELECT {', '.join(live_columns)}
+FROM flight_data
+WHERE live_updated > %s AND live_latitude IS NOT NULL AND live_longitude IS NOT NULL
+ORDER BY live_updated
+"""
+
+# The shared PostgreSQL database, reached through the connection pool.
+# Weather is loaded with COPY and flights are staged with COPY and merged.
+class PostgresStorage(Storage):
+    name = 'postgres'
+
+    def setup(self):
+        with connection() as conn:
+            ensure_weather_schema(conn)
+            ensure_flight_schema(conn)
+
+    def has_schema(self):
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT to_regclass('latest_weather') IS NOT NULL")
+                exists = cursor.fetchone()[0]
+            conn.commit()
+        return exists
+
+    def store_weather(self, batch):
+        with connection() as conn:
+            return copy_columns(conn, 'current_weather', batch, weather_batch_columns)
+
+    def latest_weather(self, cells):
+        with connection() as conn:
+            with span('db_query'), conn.cursor() as cursor:
+                cursor.execute(LATEST_WEATHER_QUERY, (sorted(cells),))
+                rows = cursor.fetchall()
+            conn.commit()
+        return rows
+
+    def read_high_water(self, feed=FLIGHT_FEED):
+        with connection() as conn:
+            return read_high_water(conn, feed)
+
+    def save_high_water(self, high_water, feed=FLIGHT_FEED):
+        with connection() as conn:
+            save_high_water(conn, high_water, feed)
+
+    def upsert_flights(self, rows, chunk_rows=COPY_CHUNK_ROWS):
+        with connection() as conn:
+            return upsert_flights(conn, rows, chunk_rows)
+
+    def live_positions(self, since):
+        with connection() as conn:
+            with span('db_query'), conn.cursor() as cursor:
+                cursor.execute(LIVE_POSITIONS_QUERY, (since,))
+                rows = cursor.fetchall()
+            conn.commit()
+        return rows
+
+    def close(self):
+        close_pool()
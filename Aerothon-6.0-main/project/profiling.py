@@ -0,0 +1,157 @@
+import cProfile
+import hmac
+import html
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+
+# Captured profiles are written here, newest kept
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'profiles'))
+PROFILES_KEPT = int(os.environ.get('PROFILES_KEPT', 200))
+# A request carrying "X-Profile: <token>" is profiled, and the same header
+# opens /profiles. Unset disables both.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+# Fraction of all other requests profiled, 0 to sample none
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Functions listed on a profile's page
+PROFILE_TOP_FUNCTIONS = 60
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+# Only one request is profiled at a time; requests arriving meanwhile run unprofiled
+_active = threading.Lock()
+_write_lock = threading.Lock()
+
+def _token_ok(supplied):
+    return bool(PROFILE_TOKEN) and bool(supplied) and hmac.compare_digest(supplied, PROFILE_TOKEN)
+
+# Why this request should be profiled, or None. Costs one header lookup when
+# profiling is not requested.
+def _trigger(request):
+    if PROFILE_TOKEN and _token_ok(request.headers.get('X-Profile')):
+        return 'header'
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sample'
+    return None
+
+# Function to write a finished profile and its details, then drop the oldest
+# captures beyond PROFILES_KEPT
+def save_profile(profiler, meta):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{int(meta['started'] * 1000)}-{meta['app']}-{meta['endpoint']}-{os.getpid()}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name + '.prof'))
+    with open(os.path.join(PROFILE_DIR, name + '.json'), 'w') as f:
+        json.dump(meta, f)
+    with _write_lock:
+        captured = sorted(entry[:-5] for entry in os.listdir(PROFILE_DIR) if entry.endswith('.json'))
+        for old in captured[:-PROFILES_KEPT]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, old + suffix))
+                except OSError:
+                    pass
+    return name
+
+# Details of every captured profile, newest first
+def list_profiles():
+    profiles = []
+    if not os.path.isdir(PROFILE_DIR):
+        return profiles
+    for entry in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if entry.endswith('.json'):
+            try:
+                with open(os.path.join(PROFILE_DIR, entry)) as f:
+                    profiles.append(dict(json.load(f), name=entry[:-5]))
+            except (OSError, ValueError):
+                pass
+    return profiles
+
+# The slowest functions of a captured profile, by cumulative time, as text
+def profile_report(name, sort='cumulative'):
+    stream = io.StringIO()
+    stats = pstats.Stats(os.path.join(PROFILE_DIR, name + '.prof'), stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(PROFILE_TOP_FUNCTIONS)
+    return stream.getvalue()
+
+def _index_page(profiles):
+    rows = ''.join(
+        f"<tr><td>{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(p['started']))}</td>"
+        f"<td>{html.escape(p['app'])}</td><td>{html.escape(p['method'])} {html.escape(p['path'])}</td>"
+        f"<td>{p['status']}</td><td>{p['duration_ms']:.1f}</td><td>{html.escape(p['trigger'])}</td>"
+        f"<td><a href=\"profiles/{html.escape(p['name'])}\">stats</a> "
+        f"<a href=\"profiles/{html.escape(p['name'])}.prof\">.prof</a></td></tr>"
+        for p in profiles)
+    return (f"<!DOCTYPE html><html><head><title>Request profiles</title></head><body>"
+            f"<h1>Request profiles</h1><p>{len(profiles)} captured, newest first.</p>"
+            f"<table border=\"1\" cellpadding=\"4\"><tr><th>Time</th><th>App</th><th>Request</th><th>Status</th>"
+            f"<th>ms</th><th>Trigger</th><th></th></tr>{rows}</table></body></html>")
+
+# Function to add opt-in cProfile capture to a Flask app. Requests are picked
+# by the X-Profile header or at PROFILE_SAMPLE_RATE; the captures are listed
+# on /profiles, which answers only to the token in the X-Profile header and
+# is missing while PROFILE_TOKEN is unset. The token never goes in a URL,
+# where proxies and access logs would keep it.
+def instrument_profiling(app, name):
+    from flask import Response, abort, g, request, send_from_directory
+
+    @app.before_request
+    def start_profile():
+        trigger = _trigger(request)
+        if trigger is None or request.endpoint in ('profiles', 'profile'):
+            return
+        if not _active.acquire(blocking=False):
+            return
+        g.profile = (cProfile.Profile(), trigger, time.time(), time.perf_counter())
+        g.profile[0].enable()
+
+    @app.after_request
+    def stop_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        profiler, trigger, started, began = profile
+        profiler.disable()
+        _active.release()
+        meta = {
+            'app': name, 'method': request.method, 'path': request.path,
+            'endpoint': request.endpoint or 'unmatched', 'status': response.status_code,
+            'started': started, 'duration_ms': (time.perf_counter() - began) * 1000, 'trigger': trigger,
+        }
+        response.headers['X-Profile-Id'] = save_profile(profiler, meta)
+        return response
+
+    # A request that failed before stop_profile ran must not hold the profiler
+    @app.teardown_request
+    def drop_profile(error):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile[0].disable()
+            _active.release()
+
+    def allowed():
+        return _token_ok(request.headers.get('X-Profile'))
+
+    def profiles():
+        if not allowed():
+            abort(404)
+        return _index_page(list_profiles())
+
+    def profile(profile_name):
+        if not allowed():
+            abort(404)
+        if profile_name.endswith('.prof'):
+            return send_from_directory(PROFILE_DIR, profile_name, as_attachment=True)
+        if not os.path.exists(os.path.join(PROFILE_DIR, profile_name + '.prof')):
+            abort(404)
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in PROFILE_SORT_KEYS:
+            abort(400)
+        return Response(profile_report(profile_name, sort),
+                        content_type='text/plain; charset=utf-8')
+
+    app.add_url_rule('/profiles', 'profiles', profiles)
+    app.add_url_rule('/profiles/<profile_name>', 'profile', profile)
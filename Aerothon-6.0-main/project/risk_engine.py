@@ -0,0 +1,135 @@
+import json
+from bisect import bisect_right
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Threshold config, re-read whenever the file changes
+RISK_THRESHOLDS_FILE = os.environ.get(
+    'RISK_THRESHOLDS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'risk_thresholds.json'))
+# Seconds between checks of the config file for changes
+RELOAD_CHECK_SECONDS = 2
+
+# A parameter below its low limit is Good, below its medium limit Fair and
+# otherwise Danger, worth 1, 2 and 3 risk points
+category_names = ["Good", "Fair", "Danger"]
+# Risk scores are bucketed into these levels by the table's level_limits
+level_names = ["Low", "Medium", "High"]
+risk_level_names = np.array(level_names)
+
+# Thresholds compiled for scoring. lows and mediums line up with names;
+# limits maps each name to its (low, medium) pair for scalar lookups.
+ThresholdTable = namedtuple('ThresholdTable', ['names', 'lows', 'mediums', 'limits', 'level_limits', 'thresholds', 'version'])
+
+_table = None
+_checked_at = 0.0
+_loaded_mtime = None
+_lock = threading.Lock()
+
+# Function to compile a thresholds dict into a ThresholdTable
+def compile_thresholds(thresholds, level_limits=(20, 40), version=0):
+    names = list(thresholds)
+    limits = {}
+    for name in names:
+        low, medium = sorted((float(thresholds[name]["low"]), float(thresholds[name]["medium"])))
+        limits[name] = (low, medium)
+    lows = np.array([limits[name][0] for name in names], dtype=np.float64)
+    mediums = np.array([limits[name][1] for name in names], dtype=np.float64)
+    return ThresholdTable(names, lows, mediums, limits, tuple(sorted(float(limit) for limit in level_limits)),
+                          thresholds, version)
+
+def load_thresholds(path=RISK_THRESHOLDS_FILE, version=0):
+    with open(path) as f:
+        config = json.load(f)
+    return compile_thresholds(config["thresholds"], config.get("risk_level_limits", (20, 40)), version)
+
+# Function to get the current ThresholdTable. The config file is checked
+# for changes at most every RELOAD_CHECK_SECONDS and recompiled when it
+# changed. A broken file keeps the previous table in use.
+def get_table():
+    global _table, _checked_at, _loaded_mtime
+    now = time.monotonic()
+    if _table is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _table
+    with _lock:
+        if _table is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+            return _table
+        _checked_at = now
+        try:
+            mtime = os.path.getmtime(RISK_THRESHOLDS_FILE)
+            if mtime != _loaded_mtime:
+                # Remembered even if loading fails, so a broken file is reported once
+                _loaded_mtime = mtime
+                version = _table.version + 1 if _table is not None else 0
+                _table = load_thresholds(RISK_THRESHOLDS_FILE, version)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if _table is None:
+                raise
+            print(f"Keeping previous risk thresholds, could not reload {RISK_THRESHOLDS_FILE}: {e}")
+        return _table
+
+# The thresholds dict currently in use
+def current_thresholds():
+    return get_table().thresholds
+
+# Risk points of one weather dict. Parameters without a threshold, and
+# missing values, add nothing.
+def score(weather_data, table=None):
+    limits = (table or get_table()).limits
+    risk_assessment = 0
+    for param, value in weather_data.items():
+        pair = limits.get(param)
+        if pair is None or value is None or value != value:
+            continue
+        risk_assessment += 1 + (value >= pair[0]) + (value >= pair[1])
+    return risk_assessment
+
+# Vectorized score: values is a (points, parameters) array whose columns are
+# the parameters in names (the table's own order by default). NaN and
+# parameters without a threshold add nothing.
+def score_batch(values, names=None, table=None):
+    table = table or get_table()
+    columns, lows, mediums = _columns(table, names)
+    values = np.asarray(values, dtype=np.float64)[:, columns]
+    points = 1 + (values >= lows).astype(np.int64) + (values >= mediums)
+    return np.where(np.isnan(values), 0, points).sum(axis=1)
+
+# Risk of each row scaled to 0..1, from no parameter above its low limit to
+# every parameter above its medium limit. NaN counts as no risk.
+def normalized_risk(values, names=None, table=None):
+    table = table or get_table()
+    columns, lows, mediums = _columns(table, names)
+    values = np.asarray(values, dtype=np.float64)[:, columns]
+    points = (values >= lows).astype(np.int64) + (values >= mediums)
+    return points.sum(axis=1) / (2.0 * len(lows))
+
+# Columns of names that have thresholds, with their low and medium limits
+def _columns(table, names):
+    if names is None or list(names) == table.names:
+        return slice(None), table.lows, table.mediums
+    columns = [i for i, name in enumerate(names) if name in table.limits]
+    lows = np.array([table.limits[names[i]][0] for i in columns], dtype=np.float64)
+    mediums = np.array([table.limits[names[i]][1] for i in columns], dtype=np.float64)
+    return columns, lows, mediums
+
+# Low, Medium or High for a risk score
+def risk_level(risk_assessment, table=None):
+    return level_names[bisect_right((table or get_table()).level_limits, risk_assessment)]
+
+def risk_level_batch(risk_assessment, table=None):
+    return risk_level_names[np.searchsorted((table or get_table()).level_limits, risk_assessment, side='right')]
+
+# Good, Fair or Danger for every parameter of a weather dict that has a threshold
+def categorize(weather_data, table=None):
+    limits = (table or get_table()).limits
+    categories = {}
+    for param, value in weather_data.items():
+        pair = limits.get(param)
+        if pair is None or value is None or value != value:
+            continue
+        categories[param] = category_names[(value >= pair[0]) + (value >= pair[1])]
+    return categories
@@ -0,0 +1,249 @@
+import heapq
+from itertools import permutations
+
+from distance_matrix import build_route_matrix, iter_scored_orderings
+
+# Above this many waypoints the subset DP table gets too big, so the search
+# switches to branch-and-bound
+HELD_KARP_LIMIT = 10
+
+# Split the route matrix into plain lists so the search only does cheap list
+# lookups. Any precomputed leg cost matrix with the same layout can be passed.
+def build_distance_table(start, end, waypoints, matrix=None):
+    if matrix is None:
+        matrix = build_route_matrix(start, end, waypoints)
+    n = len(waypoints)
+    from_start = matrix[0, 1:n + 1].tolist()
+    to_end = matrix[1:n + 1, n + 1].tolist()
+    between = matrix[1:n + 1, 1:n + 1].tolist()
+    return from_start, to_end, between
+
+# Exact shortest ordering using dynamic programming over subsets of waypoints
+def held_karp(from_start, to_end, between):
+    n = len(between)
+    full = (1 << n) - 1
+    inf = float('inf')
+    cost = [[inf] * n for _ in range(1 << n)]
+    parent = [[-1] * n for _ in range(1 << n)]
+    for j in range(n):
+        cost[1 << j][j] = from_start[j]
+
+    for mask in range(1, full + 1):
+        row = cost[mask]
+        for last in range(n):
+            base = row[last]
+            if base == inf:
+                continue
+            leg = between[last]
+            for nxt in range(n):
+                if mask & (1 << nxt):
+                    continue
+                candidate = base + leg[nxt]
+                target = cost[mask | (1 << nxt)]
+                if candidate < target[nxt]:
+                    target[nxt] = candidate
+                    parent[mask | (1 << nxt)][nxt] = last
+
+    best_last = min(range(n), key=lambda j: cost[full][j] + to_end[j])
+    total = cost[full][best_last] + to_end[best_last]
+
+    order = []
+    mask, last = full, best_last
+    while last != -1:
+        order.append(last)
+        mask, last = mask ^ (1 << last), parent[mask][last]
+    order.reverse()
+    return [(order, total)]
+
+# Leg costs between waypoints 0..n-1, the start (n) and the end (n + 1).
+# The direct start-end leg can never be part of a route through waypoints.
+def _full_cost(from_start, to_end, between):
+    inf = float('inf')
+    cost = [row + [from_start[i], to_end[i]] for i, row in enumerate(between)]
+    cost.append(from_start + [inf, inf])
+    cost.append(to_end + [inf, inf])
+    return cost
+
+# Minimum spanning tree over nodes with every leg cost raised by the penalties
+# of both its ends. Returns the tree weight and the degree of each node.
+def _spanning_tree(nodes, cost, penalty):
+    root = nodes[0]
+    reach = {i: cost[root][i] + penalty[root] + penalty[i] for i in nodes[1:]}
+    link = {i: root for i in nodes[1:]}
+    degree = dict.fromkeys(nodes, 0)
+    total = 0.0
+    while reach:
+        closest = min(reach, key=reach.get)
+        total += reach.pop(closest)
+        degree[closest] += 1
+        degree[link[closest]] += 1
+        leg = cost[closest]
+        extra = penalty[closest]
+        for i in reach:
+            weight = leg[i] + extra + penalty[i]
+            if weight < reach[i]:
+                reach[i] = weight
+                link[i] = closest
+    return total, degree
+
+# Held-Karp degree penalties found by subgradient ascent. A route visits every
+# waypoint with degree 2 and the start and end with degree 1, so for any
+# penalties the penalised spanning tree weight minus the penalised target
+# degrees is a lower bound on route length; ascent makes that bound tight.
+def _degree_penalties(cost, upper, rounds=80):
+    size = len(cost)
+    nodes = list(range(size))
+    target = [2] * (size - 2) + [1, 1]
+    penalty = [0.0] * size
+    best_penalty, best_bound = penalty, float('-inf')
+    step = 2.0
+    for _ in range(rounds):
+        total, degree = _spanning_tree(nodes, cost, penalty)
+        bound = total - sum(t * p for t, p in zip(target, penalty))
+        if bound > best_bound:
+            best_penalty, best_bound = penalty, bound
+        gap = [degree[i] - target[i] for i in nodes]
+        norm = sum(g * g for g in gap)
+        if norm == 0:
+            # The tree is itself a route, so the bound is already exact
+            break
+        move = step * (upper - bound) / norm
+        penalty = [p + move * g for p, g in zip(penalty, gap)]
+        step *= 0.95
+    return best_penalty
+
+# Quick nearest-neighbour tour tidied up with 2-opt, used as the first incumbent
+def _greedy_order(from_start, to_end, between):
+    n = len(between)
+    remaining = set(range(n))
+    current = min(remaining, key=lambda j: from_start[j])
+    order = [current]
+    remaining.remove(current)
+    while remaining:
+        current = min(remaining, key=lambda j: between[current][j])
+        order.append(current)
+        remaining.remove(current)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                if _order_length(candidate, from_start, to_end, between) < _order_length(order, from_start, to_end, between) - 1e-9:
+                    order = candidate
+                    improved = True
+    return order
+
+def _order_length(order, from_start, to_end, between):
+    total = from_start[order[0]] + to_end[order[-1]]
+    for a, b in zip(order, order[1:]):
+        total += between[a][b]
+    return total
+
+# Exact k shortest orderings by depth-first branch-and-bound
+def branch_and_bound(from_start, to_end, between, k=1):
+    n = len(between)
+    full = (1 << n) - 1
+    nearest = [sorted(range(n), key=lambda j: between[i][j]) for i in range(n)]
+    cost = _full_cost(from_start, to_end, between)
+    bounds = {}
+    # k cheapest partial costs seen for each (visited set, last waypoint)
+    seen = {}
+    # max-heap of the k best complete routes as (-length, order)
+    best = []
+
+    order = _greedy_order(from_start, to_end, between)
+    greedy_length = _order_length(order, from_start, to_end, between)
+    if k == 1:
+        best.append((-greedy_length, order))
+    penalty = _degree_penalties(cost, greedy_length)
+
+    def cutoff():
+        return -best[0][0] if len(best) >= k else float('inf')
+
+    # Lower bound on finishing through the unvisited waypoints in rest, less the
+    # penalised exit leg: penalised spanning tree over rest plus the end,
+    # minus the penalties of their target degrees
+    def remaining_bound(rest):
+        if rest not in bounds:
+            nodes = [n + 1] + [i for i in range(n) if rest & (1 << i)]
+            total, _ = _spanning_tree(nodes, cost, penalty)
+            bounds[rest] = total - penalty[n + 1] - 2 * sum(penalty[i] for i in nodes[1:])
+        return bounds[rest]
+
+    def dominated(mask, last, length):
+        lengths = seen.setdefault((mask, last), [])
+        if len(lengths) >= k and length >= -lengths[0]:
+            return True
+        if len(lengths) >= k:
+            heapq.heapreplace(lengths, -length)
+        else:
+            heapq.heappush(lengths, -length)
+        return False
+
+    def search(order, mask, length):
+        last = order[-1]
+        if mask == full:
+            total = length + to_end[last]
+            if len(best) < k:
+                heapq.heappush(best, (-total, list(order)))
+            elif total < -best[0][0]:
+                heapq.heapreplace(best, (-total, list(order)))
+            return
+        if dominated(mask, last, length):
+            return
+        rest = full ^ mask
+        leg = between[last]
+        exit_leg = min(leg[j] + penalty[j] for j in range(n) if rest & (1 << j))
+        if length + exit_leg + remaining_bound(rest) >= cutoff():
+            return
+        for nxt in nearest[last]:
+            if not rest & (1 << nxt):
+                continue
+            step = length + leg[nxt]
+            if step + to_end[nxt] >= cutoff():
+                continue
+            order.append(nxt)
+            search(order, mask | (1 << nxt), step)
+            order.pop()
+
+    for first in sorted(range(n), key=lambda j: from_start[j]):
+        search([first], 1 << first, from_start[first])
+
+    return sorted(((order, -length) for length, order in best), key=lambda x: x[1])
+
+# Shortest k routes through every waypoint, in ascending order of distance.
+# Gives the same result as sorting all permutations, without building them.
+def find_optimal_routes(start, end, waypoints, k=1, matrix=None):
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    if matrix is None:
+        matrix = build_route_matrix(start, end, waypoints)
+    if not waypoints:
+        return [([start, end], float(matrix[0, 1]))]
+
+    from_start, to_end, between = build_distance_table(start, end, waypoints, matrix)
+    if k == 1 and len(waypoints) <= HELD_KARP_LIMIT:
+        ranked = held_karp(from_start, to_end, between)
+    else:
+        ranked = branch_and_bound(from_start, to_end, between, k)
+
+    return [([start] + [waypoints[i] for i in order] + [end], total) for order, total in ranked]
+
+# Every route through the waypoints with its length, generated lazily in
+# permutation order. Only one scoring batch is held in memory at a time.
+def iter_routes(start, end, waypoints, matrix=None):
+    if matrix is None:
+        matrix = build_route_matrix(start, end, waypoints)
+    for order, total_distance in iter_scored_orderings(matrix, permutations(range(len(waypoints))), len(waypoints)):
+        yield [start] + [waypoints[i] for i in order] + [end], total_distance
+
+# The k shortest routes from the full enumeration, keeping only a k-sized heap.
+# Route lists are only built for the winners.
+def find_top_routes(start, end, waypoints, k, matrix=None):
+    if matrix is None:
+        matrix = build_route_matrix(start, end, waypoints)
+    scored = iter_scored_orderings(matrix, permutations(range(len(waypoints))), len(waypoints))
+    top = heapq.nsmallest(k, scored, key=lambda x: x[1])
+    return [([start] + [waypoints[i] for i in order] + [end], total_distance) for order, total_distance in top]
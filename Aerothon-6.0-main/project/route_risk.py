@@ -0,0 +1,75 @@
+import numpy as np
+
+from distance_matrix import build_route_matrix, path_length
+from route_optimizer import find_optimal_routes, find_top_routes
+from risk_engine import compile_thresholds, get_table, normalized_risk
+from weather_cache import fetch_current_values, get_current_values_many
+
+# Points sampled along each great-circle leg, endpoints included
+SAMPLES_PER_LEG = 8
+# Risk of a cell whose weather could not be fetched. Unknown weather counts
+# as the worst, so an outage never makes a route look safe.
+UNKNOWN_RISK = 1.0
+# Extra cost of a leg flown entirely through maximum risk, as a fraction of its length
+DEFAULT_RISK_WEIGHT = 1.0
+# Above this many waypoints the cost search uses the optimizer instead of enumerating
+MAX_ENUMERATED_WAYPOINTS = 7
+
+# Points along the great circle between every pair of route points. Returns a
+# (pairs, samples, 2) array of (lat, lon) and the (i, j) index of each pair.
+def sample_legs(points, samples_per_leg=SAMPLES_PER_LEG):
+    coords = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    unit = np.stack([
+        np.cos(coords[:, 0]) * np.cos(coords[:, 1]),
+        np.cos(coords[:, 0]) * np.sin(coords[:, 1]),
+        np.sin(coords[:, 0]),
+    ], axis=1)
+    first, second = np.triu_indices(len(unit), k=1)
+    a = unit[first][:, None, :]
+    b = unit[second][:, None, :]
+    omega = np.arccos(np.clip((unit[first] * unit[second]).sum(axis=1), -1.0, 1.0))[:, None, None]
+    fraction = np.linspace(0.0, 1.0, samples_per_leg)[None, :, None]
+    sin_omega = np.sin(omega)
+    # Spherical interpolation, falling back to linear for coincident points
+    safe = sin_omega > 1e-12
+    weight_a = np.where(safe, np.sin((1 - fraction) * omega) / np.where(safe, sin_omega, 1), 1 - fraction)
+    weight_b = np.where(safe, np.sin(fraction * omega) / np.where(safe, sin_omega, 1), fraction)
+    samples = weight_a * a + weight_b * b
+    samples /= np.linalg.norm(samples, axis=2, keepdims=True)
+    lat = np.degrees(np.arcsin(np.clip(samples[..., 2], -1.0, 1.0)))
+    lon = np.degrees(np.arctan2(samples[..., 1], samples[..., 0]))
+    return np.stack([lat, lon], axis=2), first, second
+
+# Normalised risk at each (lat, lon) point. Weather comes from the shared
+# grid-cell cache in weather_cache, with every missing cell fetched together,
+# and is scored with the given thresholds or the risk engine's current ones.
+# Points whose weather is unknown get UNKNOWN_RISK.
+def lookup_risk(points, thresholds=None, fetch=fetch_current_values):
+    table = get_table() if thresholds is None else compile_thresholds(thresholds)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    values = get_current_values_many(points.tolist(), table.names, fetch)
+    risk = normalized_risk(values, table=table)
+    risk[np.isnan(values).all(axis=1)] = UNKNOWN_RISK
+    return risk
+
+# Leg cost matrix in the distance matrix layout: each leg's length scaled up
+# by the mean risk sampled along it
+def build_cost_matrix(start, end, waypoints, thresholds=None, risk_weight=DEFAULT_RISK_WEIGHT, fetch=fetch_current_values):
+    points = [start] + list(waypoints) + [end]
+    distances = build_route_matrix(start, end, waypoints)
+    samples, first, second = sample_legs(points)
+    risk = lookup_risk(samples.reshape(-1, 2), thresholds, fetch).reshape(samples.shape[:2]).mean(axis=1)
+    leg_risk = np.zeros_like(distances)
+    leg_risk[first, second] = risk
+    leg_risk[second, first] = risk
+    return distances * (1 + risk_weight * leg_risk)
+
+# The k routes with the lowest combined distance and en-route weather risk, as
+# (route, distance, cost) tuples in ascending order of cost
+def find_safest_routes(start, end, waypoints, thresholds=None, k=1, risk_weight=DEFAULT_RISK_WEIGHT, fetch=fetch_current_values):
+    costs = build_cost_matrix(start, end, waypoints, thresholds, risk_weight, fetch)
+    if len(waypoints) > MAX_ENUMERATED_WAYPOINTS:
+        ranked = find_optimal_routes(start, end, waypoints, k, matrix=costs)
+    else:
+        ranked = find_top_routes(start, end, waypoints, k, matrix=costs)
+    return [(route, path_length(route), cost) for route, cost in ranked]
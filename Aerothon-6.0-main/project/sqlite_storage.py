@@ -0,0 +1,286 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timezone
+
+from bulk_loader import COPY_CHUNK_ROWS, report_load
+from flight_schema import column_types, flight_key, live_columns
+from flight_sync import FLIGHT_FEED, flight_columns, parse_time
+from metrics import span
+from storage import Storage, weather_batch_columns
+from weather_schema import weather_columns
+
+# Database file of the embedded backend
+SQLITE_PATH = os.environ.get(
+    'SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'flight_navigation.db'))
+# Milliseconds a writer waits for another connection's write to finish
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 30000))
+# Most connections open at once; callers beyond this wait for one to be returned
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+# Seconds to wait for a free connection before giving up
+SQLITE_CHECKOUT_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT', 5))
+
+# PostgreSQL column types and the SQLite affinity they are stored with.
+# Timestamps are stored as ISO 8601 text in UTC, which sorts by time.
+_sqlite_types = {'DOUBLE PRECISION': 'REAL', 'BOOLEAN': 'INTEGER', 'INTEGER': 'INTEGER'}
+_time_columns = [column for column in flight_columns if column_types.get(column) == 'TIMESTAMPTZ']
+_time_indexes = [flight_columns.index(column) for column in _time_columns]
+_key_indexes = [flight_columns.index(column) for column in flight_key]
+_updated_index = flight_columns.index('live_updated')
+_changing_columns = [column for column in flight_columns if column not in flight_key]
+
+_weather_ddl = ",\n    ".join(f"{column} REAL" for column in weather_columns)
+_flight_ddl = ",\n    ".join(f"{column} {_sqlite_types.get(column_types.get(column), 'TEXT')}"
+                             for column in flight_columns)
+
+# The same tables and indexes as the PostgreSQL schema (see weather_schema
+# and flight_schema). latitude + 90 and longitude + 180 are never negative,
+# so CAST rounds them down like floor() does.
+SCHEMA_DDL = f"""
+CREATE TABLE IF NOT EXISTS current_weather (
+    id INTEGER PRIMARY KEY,
+    time TEXT,
+    latitude REAL,
+    longitude REAL,
+    {_weather_ddl}
+);
+CREATE INDEX IF NOT EXISTS current_weather_location_time_idx
+    ON current_weather (latitude, longitude, time DESC);
+
+CREATE TABLE IF NOT EXISTS latest_weather (
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    time TEXT,
+    {_weather_ddl},
+    grid_cell INTEGER GENERATED ALWAYS AS
+        (CAST(latitude + 90 AS INTEGER) * 360 + CAST(longitude + 180 AS INTEGER) % 360) STORED,
+    PRIMARY KEY (latitude, longitude)
+);
+CREATE INDEX IF NOT EXISTS latest_weather_grid_cell_idx ON latest_weather (grid_cell);
+
+CREATE TABLE IF NOT EXISTS flight_data (
+    id INTEGER PRIMARY KEY,
+    {_flight_ddl}
+);
+CREATE UNIQUE INDEX IF NOT EXISTS flight_data_natural_key ON flight_data ({', '.join(flight_key)});
+CREATE INDEX IF NOT EXISTS flight_data_live_updated_idx ON flight_data (live_updated);
+
+CREATE TABLE IF NOT EXISTS ingest_state (
+    name TEXT PRIMARY KEY,
+    high_water TEXT
+);
+"""
+
+# SQLite triggers run once per row, which is cheap in-process
+LATEST_WEATHER_TRIGGER_DDL = f"""
+CREATE TRIGGER IF NOT EXISTS current_weather_latest
+AFTER INSERT ON current_weather
+WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+BEGIN
+    INSERT INTO latest_weather (latitude, longitude, time, {', '.join(weather_columns)})
+    VALUES (NEW.latitude, NEW.longitude, NEW.time, {', '.join(f'NEW.{column}' for column in weather_columns)})
+    ON CONFLICT (latitude, longitude) DO UPDATE SET
+        time = excluded.time,
+        {', '.join(f'{column} = excluded.{column}' for column in weather_columns)}
+    WHERE latest_weather.time IS NULL OR excluded.time >= latest_weather.time;
+END;
+"""
+
+# Seed latest_weather from existing history the first time it is created.
+# With MAX() SQLite takes the other columns from the newest row of each group.
+LATEST_WEATHER_BACKFILL = f"""
+INSERT INTO latest_weather (latitude, longitude, time, {', '.join(weather_columns)})
+SELECT latitude, longitude, MAX(time), {', '.join(weather_columns)}
+FROM current_weather
+WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM latest_weather)
+GROUP BY latitude, longitude
+"""
+
+INSERT_WEATHER_SQL = f"""
+INSERT INTO current_weather ({', '.join(weather_batch_columns)})
+VALUES ({', '.join('?' for _ in weather_batch_columns)})
+"""
+
+LATEST_WEATHER_QUERY = f"""
+SELECT latitude, longitude, {', '.join(weather_columns)}
+FROM latest_weather
+WHERE grid_cell IN (SELECT value FROM json_each(?))
+"""
+
+LIVE_POSITIONS_QUERY = f"""
+SELECT {', '.join(live_columns)}
+FROM flight_data
+WHERE live_updated > ? AND live_latitude IS NOT NULL AND live_longitude IS NOT NULL
+ORDER BY live_updated
+"""
+
+# Same rules as the PostgreSQL merge: unchanged rows are left alone and an
+# older report never overwrites a newer one
+UPSERT_SQL = f"""
+INSERT INTO flight_data ({', '.join(flight_columns)})
+VALUES ({', '.join('?' for _ in flight_columns)})
+ON CONFLICT ({', '.join(flight_key)}) DO UPDATE SET
+    {', '.join(f'{column} = excluded.{column}' for column in _changing_columns)}
+WHERE ({' OR '.join(f'flight_data.{column} IS NOT excluded.{column}' for column in _changing_columns)})
+  AND (flight_data.live_updated IS NULL OR excluded.live_updated IS NULL
+       OR excluded.live_updated >= flight_data.live_updated)
+"""
+
+def _time_text(value):
+    parsed = parse_time(value)
+    return None if parsed is None else parsed.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+def _weather_time_text(value):
+    return None if value is None else value.isoformat(sep=' ')
+
+def _value(value):
+    return None if value != value else value
+
+# An embedded SQLite database in WAL mode, so readers never wait for the
+# writer. Connections are pooled, pool_size at most, and borrowed per call
+# like db_pool's, so short-lived request threads don't each keep one open.
+class SQLiteStorage(Storage):
+    name = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH, pool_size=SQLITE_POOL_SIZE):
+        self.path = path
+        self.slots = threading.BoundedSemaphore(max(1, pool_size))
+        self.idle = queue.LifoQueue()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        with span('db_connect'):
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT / 1000, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    # Context manager that borrows a connection and hands it back afterwards.
+    # Any open transaction is rolled back before the connection is reused.
+    @contextmanager
+    def connection(self, timeout=SQLITE_CHECKOUT_TIMEOUT):
+        if not self.slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError("No SQLite connection available within %s seconds" % timeout)
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+        except Exception:
+            self.slots.release()
+            raise
+        try:
+            yield conn
+        finally:
+            with self.lock:
+                owned = any(open_conn is conn for open_conn in self.connections)
+            if owned:
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    self.idle.put(conn)
+                except sqlite3.Error:
+                    self._discard(conn)
+            self.slots.release()
+
+    def _discard(self, conn):
+        with self.lock:
+            self.connections = [open_conn for open_conn in self.connections if open_conn is not conn]
+        conn.close()
+
+    def setup(self):
+        with self.connection() as conn, conn:
+            conn.executescript(SCHEMA_DDL + LATEST_WEATHER_TRIGGER_DDL)
+            conn.execute(LATEST_WEATHER_BACKFILL)
+
+    def has_schema(self):
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latest_weather'").fetchone()
+        return row is not None
+
+    def store_weather(self, batch):
+        started = time.perf_counter()
+        columns = [[_weather_time_text(value) for value in batch['time']]]
+        columns += [[_value(value) for value in batch[column].tolist()] for column in weather_batch_columns[1:]]
+        with self.connection() as conn, conn:
+            conn.executemany(INSERT_WEATHER_SQL, zip(*columns))
+        return report_load('current_weather', len(columns[0]), started)
+
+    def latest_weather(self, cells):
+        with self.connection() as conn, span('db_query'):
+            return conn.execute(LATEST_WEATHER_QUERY, (json.dumps(sorted(cells)),)).fetchall()
+
+    def read_high_water(self, feed=FLIGHT_FEED):
+        with self.connection() as conn:
+            row = conn.execute("SELECT high_water FROM ingest_state WHERE name = ?", (feed,)).fetchone()
+        return parse_time(row[0]) if row and row[0] else None
+
+    def save_high_water(self, high_water, feed=FLIGHT_FEED):
+        if high_water is None:
+            return
+        with self.connection() as conn, conn:
+            conn.execute("""
+            INSERT INTO ingest_state (name, high_water) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET high_water = MAX(ingest_state.high_water, excluded.high_water)
+            """, (feed, _time_text(high_water)))
+
+    # Rows are merged chunk_rows at a time. Within a chunk the most recently
+    # updated copy of each flight wins, as in the PostgreSQL merge.
+    def upsert_flights(self, rows, chunk_rows=COPY_CHUNK_ROWS):
+        with self.connection() as conn:
+            return self._upsert(conn, rows, chunk_rows)
+
+    def _upsert(self, conn, rows, chunk_rows):
+        inserted = updated = 0
+        chunk = {}
+        for row in rows:
+            row = list(row)
+            for index in _time_indexes:
+                row[index] = _time_text(row[index])
+            key = tuple(row[index] for index in _key_indexes)
+            if None in key:
+                continue
+            previous = chunk.get(key)
+            if previous is None or (row[_updated_index] or '') >= (previous[_updated_index] or ''):
+                chunk[key] = row
+            if len(chunk) >= chunk_rows:
+                counts = self._merge(conn, chunk.values())
+                inserted, updated = inserted + counts[0], updated + counts[1]
+                chunk = {}
+        if chunk:
+            counts = self._merge(conn, chunk.values())
+            inserted, updated = inserted + counts[0], updated + counts[1]
+        return inserted, updated
+
+    def _merge(self, conn, rows):
+        with conn:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM flight_data").fetchone()[0]
+            changes = conn.total_changes
+            conn.executemany(UPSERT_SQL, rows)
+            changed = conn.total_changes - changes
+            inserted = conn.execute("SELECT COUNT(*) FROM flight_data WHERE id > ?", (last_id,)).fetchone()[0]
+        return inserted, changed - inserted
+
+    def live_positions(self, since):
+        with self.connection() as conn, span('db_query'):
+            return conn.execute(LIVE_POSITIONS_QUERY, (_time_text(since),)).fetchall()
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        while True:
+            try:
+                self.idle.get_nowait()
+            except queue.Empty:
+                break
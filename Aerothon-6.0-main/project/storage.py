@@ -0,0 +1,95 @@
+import os
+import threading
+
+from bulk_loader import COPY_CHUNK_ROWS
+from flight_sync import FLIGHT_FEED, fresh_rows
+from weather_schema import weather_columns
+
+# Where weather and flights are kept: "postgres" (the shared database) or
+# "sqlite" (an embedded file, for edge deployments and single-machine tests)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'postgres')
+
+# Columns of a columnar weather batch, in table order
+weather_batch_columns = ['time', 'latitude', 'longitude'] + weather_columns
+
+_storage = None
+_lock = threading.Lock()
+
+# What every backend provides. A backend implements setup, has_schema,
+# store_weather, latest_weather, read_high_water, save_high_water,
+# upsert_flights, live_positions and close; the incremental flight sync is
+# built on top of them here.
+class Storage:
+    name = None
+
+    # Create every table, index and trigger if missing. Run by the collectors
+    # and setup scripts only: it takes table locks that block writers.
+    def setup(self):
+        raise NotImplementedError
+
+    # Whether the weather tables setup creates exist. A catalogue lookup,
+    # cheap enough for request paths, which must not run DDL.
+    def has_schema(self):
+        raise NotImplementedError
+
+    # Store a columnar weather batch in current_weather. Returns (rows, rows/sec).
+    def store_weather(self, batch):
+        raise NotImplementedError
+
+    # Newest observation of every location in the given grid cells, as
+    # (latitude, longitude, *weather_columns) tuples
+    def latest_weather(self, cells):
+        raise NotImplementedError
+
+    def read_high_water(self, feed=FLIGHT_FEED):
+        raise NotImplementedError
+
+    # Move the high-water mark forward. It never moves back.
+    def save_high_water(self, high_water, feed=FLIGHT_FEED):
+        raise NotImplementedError
+
+    # Upsert flight rows on the natural key. Returns (inserted, updated).
+    def upsert_flights(self, rows, chunk_rows=COPY_CHUNK_ROWS):
+        raise NotImplementedError
+
+    # Flights with a live position reported after since, as tuples in
+    # flight_schema.live_columns order, oldest report first
+    def live_positions(self, since):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    # Function to run one incremental sync: skip flights not updated since
+    # the last run, upsert the rest, then record the new high-water mark
+    def sync_flights(self, rows, chunk_rows=COPY_CHUNK_ROWS):
+        progress = {}
+        inserted, updated = self.upsert_flights(fresh_rows(rows, self.read_high_water(), progress), chunk_rows)
+        self.save_high_water(progress['newest'])
+        print(f"Synced flights: {inserted} inserted, {updated} updated, {progress['skipped']} skipped as unchanged")
+        return inserted, updated
+
+# Function to get the storage backend for this process, picked by
+# STORAGE_BACKEND. Backends are imported on first use, so the SQLite one
+# runs without the PostgreSQL driver installed.
+def get_storage():
+    global _storage
+    with _lock:
+        if _storage is None:
+            if STORAGE_BACKEND == 'postgres':
+                from postgres_storage import PostgresStorage
+                _storage = PostgresStorage()
+            elif STORAGE_BACKEND == 'sqlite':
+                from sqlite_storage import SQLiteStorage
+                _storage = SQLiteStorage()
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, expected 'postgres' or 'sqlite'")
+        return _storage
+
+# Function to close the backend's connections, e.g. at shutdown
+def close_storage():
+    global _storage
+    with _lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
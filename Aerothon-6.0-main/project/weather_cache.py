@@ -0,0 +1,194 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+import requests
+
+from metrics import span
+
+# Open-Meteo endpoint, overridable so the pages can run against a local stub server
+OPEN_METEO_URL = os.environ.get('OPEN_METEO_URL', 'https://api.open-meteo.com/v1/forecast')
+
+# Coordinates are snapped to cells of this size, in degrees, roughly the
+# resolution of the Open-Meteo models
+WEATHER_GRID_DEGREES = 0.1
+# Open-Meteo refreshes current conditions every 15 minutes, so a cached cell
+# is kept until the next refresh boundary
+MODEL_UPDATE_SECONDS = 900
+# Cells kept before the least recently used is evicted
+WEATHER_CACHE_SIZE = 4096
+# Cells of current variable values kept, enough for a few planner rasters
+VALUES_CACHE_SIZE = 65536
+# Coordinates sent in one multi-location Open-Meteo request
+FETCH_BATCH_SIZE = 100
+# Seconds a caller waits for a fetch another caller already started
+FETCH_TIMEOUT = 15
+# Seconds a page waits for all of its point fetches together
+FETCH_DEADLINE = float(os.environ.get('WEATHER_FETCH_DEADLINE', 5))
+# Point fetches run at once, and keep-alive connections kept open to Open-Meteo
+FETCH_WORKERS = 8
+
+# cell -> (weather, expires_at), least recently used first
+_entries = OrderedDict()
+# cell -> [event, weather] for fetches under way
+_in_flight = {}
+# cell -> ({variable: value}, expires_at) from the 'current' API, least recently used first
+_values = OrderedDict()
+_lock = threading.Lock()
+cache_stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+# One keep-alive session and worker pool shared by every request
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_WORKERS))
+session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_WORKERS))
+_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='weather-fetch')
+
+def snap(latitude, longitude):
+    return (int(math.floor(latitude / WEATHER_GRID_DEGREES + 0.5)),
+            int(math.floor(longitude / WEATHER_GRID_DEGREES + 0.5)))
+
+# Function to fetch the current weather at a point, or None if it failed
+def fetch_current_weather(latitude, longitude, timeout=FETCH_TIMEOUT):
+    params = {"latitude": latitude, "longitude": longitude, "current_weather": True}
+    with span('open_meteo'):
+        try:
+            response = session.get(OPEN_METEO_URL, params=params, timeout=timeout)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json().get('current_weather')
+
+# Current weather for the grid cell containing a point. Cached cells are
+# served until the next model update. When several threads miss on the same
+# cell at once, only the first fetches and the rest wait for its result.
+# Failed fetches are not cached.
+def get_current_weather(latitude, longitude, fetch=fetch_current_weather):
+    cell = snap(latitude, longitude)
+    with _lock:
+        entry = _entries.get(cell)
+        if entry and entry[1] > time.time():
+            _entries.move_to_end(cell)
+            cache_stats['hits'] += 1
+            return entry[0]
+        flight = _in_flight.get(cell)
+        if flight is None:
+            flight = _in_flight[cell] = [threading.Event(), None]
+            leader = True
+            cache_stats['misses'] += 1
+        else:
+            leader = False
+            cache_stats['coalesced'] += 1
+
+    if not leader:
+        flight[0].wait(FETCH_TIMEOUT)
+        return flight[1]
+
+    weather = None
+    try:
+        weather = fetch(round(cell[0] * WEATHER_GRID_DEGREES, 4), round(cell[1] * WEATHER_GRID_DEGREES, 4))
+    finally:
+        with _lock:
+            if weather is not None:
+                expires_at = (time.time() // MODEL_UPDATE_SECONDS + 1) * MODEL_UPDATE_SECONDS
+                _entries[cell] = (weather, expires_at)
+                _entries.move_to_end(cell)
+                while len(_entries) > WEATHER_CACHE_SIZE:
+                    _entries.popitem(last=False)
+            del _in_flight[cell]
+        flight[1] = weather
+        flight[0].set()
+    return weather
+
+# Current weather at many points at once. Every point is looked up through
+# the cache on the shared worker pool, so the wait is bounded by the slowest
+# single fetch. Points not answered within deadline seconds come back None.
+def get_current_weather_many(points, deadline=FETCH_DEADLINE):
+    fetch = lambda latitude, longitude: fetch_current_weather(latitude, longitude, deadline)
+    futures = [_executor.submit(get_current_weather, latitude, longitude, fetch) for latitude, longitude in points]
+    wait(futures, timeout=deadline)
+    return [future.result() if future.done() and not future.exception() else None for future in futures]
+
+def _fetch_values_batch(batch, names, timeout):
+    params = {
+        "latitude": ",".join(f"{lat:.4f}" for lat, _ in batch),
+        "longitude": ",".join(f"{lon:.4f}" for _, lon in batch),
+        "current": ",".join(names),
+    }
+    with span('open_meteo'):
+        try:
+            response = session.get(OPEN_METEO_URL, params=params, timeout=timeout)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        data = response.json()
+    # A single location comes back as an object rather than a list
+    if isinstance(data, dict):
+        data = [data]
+    return [location.get('current', {}) for location in data]
+
+# Current values of the named variables at many points, as a (points, names)
+# array, using the multi-location form of the API with the batches spread
+# over the shared worker pool. Failed batches come back as NaN.
+def fetch_current_values(points, names, timeout=FETCH_TIMEOUT):
+    values = np.full((len(points), len(names)), np.nan)
+    offsets = range(0, len(points), FETCH_BATCH_SIZE)
+    batches = _executor.map(lambda offset: _fetch_values_batch(points[offset:offset + FETCH_BATCH_SIZE], names,
+                                                                timeout), offsets)
+    for offset, batch in zip(offsets, batches):
+        for row, current in enumerate(batch or ()):
+            for column, name in enumerate(names):
+                value = current.get(name)
+                if value is not None:
+                    values[offset + row, column] = value
+    return values
+
+# Current values of the named variables at many points, as a (points, names)
+# array. Points are snapped to the same cells as get_current_weather and kept
+# until the next model update; every cell missing from the cache is fetched
+# in one call of fetch(cell_centres, names). Cells that could not be fetched
+# are NaN and are not cached.
+def get_current_values_many(points, names, fetch=fetch_current_values):
+    names = list(names)
+    cells = [snap(latitude, longitude) for latitude, longitude in points]
+    found = {}
+    missing = []
+    now = time.time()
+    with _lock:
+        for cell in dict.fromkeys(cells):
+            entry = _values.get(cell)
+            if entry and entry[1] > now and all(name in entry[0] for name in names):
+                _values.move_to_end(cell)
+                found[cell] = entry[0]
+                cache_stats['hits'] += 1
+            else:
+                missing.append(cell)
+                cache_stats['misses'] += 1
+
+    if missing:
+        centres = [(round(lat * WEATHER_GRID_DEGREES, 4), round(lon * WEATHER_GRID_DEGREES, 4))
+                   for lat, lon in missing]
+        fetched = fetch(centres, names)
+        expires_at = (time.time() // MODEL_UPDATE_SECONDS + 1) * MODEL_UPDATE_SECONDS
+        with _lock:
+            for cell, row in zip(missing, fetched.tolist()):
+                current = dict(zip(names, row))
+                found[cell] = current
+                if not all(value != value for value in row):
+                    _values[cell] = (current, expires_at)
+                    _values.move_to_end(cell)
+            while len(_values) > VALUES_CACHE_SIZE:
+                _values.popitem(last=False)
+
+    return np.array([[found[cell].get(name, np.nan) for name in names] for cell in cells],
+                    dtype=np.float64).reshape(len(cells), len(names))
+
+def clear_cache():
+    with _lock:
+        _entries.clear()
+        _values.clear()
@@ -0,0 +1,111 @@
+import math
+import os
+
+import numpy as np
+
+from airport_registry import grid_cells
+from distance_matrix import EARTH_RADIUS_KM, cross_distances
+from storage import get_storage
+from weather_schema import weather_columns
+
+# Observations further away than this are ignored
+DEFAULT_RADIUS_KM = float(os.environ.get('WEATHER_LOOKUP_RADIUS_KM', 50))
+# Largest radius and neighbour count a lookup accepts; larger requests are
+# clamped so one call cannot read the whole latest_weather table
+MAX_RADIUS_KM = 500
+MAX_NEIGHBOURS = 16
+# Power used by inverse-distance weighting
+IDW_POWER = 2
+# Anything closer than this counts as the same location
+SAME_POINT_KM = 1e-3
+
+_schema_ready = False
+
+# Whether the weather tables exist yet. They are created by the collectors
+# (collect_data.setup_database or the daemon), never on this read path.
+def schema_ready():
+    global _schema_ready
+    if not _schema_ready:
+        _schema_ready = get_storage().has_schema()
+    return _schema_ready
+
+# Grid cell numbers of every 1 degree cell touching the box of radius_km around a point
+def cells_covering(latitude, longitude, radius_km):
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south = max(math.floor(latitude - dlat), -90)
+    north = min(math.floor(latitude + dlat), 89)
+    cos_lat = math.cos(math.radians(min(abs(latitude) + dlat, 89.9)))
+    dlon = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180)
+    west = math.floor(longitude - dlon)
+    east = math.floor(longitude + dlon)
+    if east - west >= 359:
+        west, east = -180, 179
+    cells = set()
+    for row in range(south, north + 1):
+        for col in range(west, east + 1):
+            cells.add((row + 90) * 360 + (col + 180) % 360)
+    return cells
+
+# Newest observation of every location in the given cells, as a coordinate
+# array and a matching array of weather values. Nothing has been observed
+# until the tables exist.
+def fetch_candidates(cells):
+    rows = get_storage().latest_weather(cells) if schema_ready() else []
+    table = np.array(rows, dtype=np.float64).reshape(-1, 2 + len(weather_columns))
+    return table[:, :2], table[:, 2:]
+
+# Weather values at many points from the nearest observations within
+# radius_km. With neighbours > 1 the k nearest observations are blended by
+# inverse-distance weighting. Rows are NaN where nothing is in range. Each
+# point is only measured against the observations in its own cells.
+def lookup_weather(latitudes, longitudes, radius_km=DEFAULT_RADIUS_KM, neighbours=1):
+    radius_km = min(max(float(radius_km), 0.0), MAX_RADIUS_KM)
+    neighbours = max(1, min(int(neighbours), MAX_NEIGHBOURS))
+    points = np.column_stack([latitudes, longitudes]).astype(np.float64)
+    result = np.full((len(points), len(weather_columns)), np.nan)
+    point_cells = [cells_covering(latitude, longitude, radius_km) for latitude, longitude in points.tolist()]
+    coords, values = fetch_candidates(set().union(*point_cells))
+    if not len(coords):
+        return result
+
+    # Candidates sorted by cell, so each cell is one contiguous slice
+    candidate_cells = grid_cells(coords[:, 0], coords[:, 1])
+    order = np.argsort(candidate_cells, kind='stable')
+    coords, values = coords[order], values[order]
+    cells, starts, counts = np.unique(candidate_cells[order], return_index=True, return_counts=True)
+    slices = dict(zip(cells.tolist(), zip(starts.tolist(), (starts + counts).tolist())))
+
+    nearest = np.zeros((len(points), neighbours), dtype=np.int64)
+    nearest_distances = np.full((len(points), neighbours), np.inf)
+    for row, covering in enumerate(point_cells):
+        ranges = [np.arange(*slices[cell]) for cell in covering if cell in slices]
+        if not ranges:
+            continue
+        candidates = np.concatenate(ranges)
+        distances = cross_distances(points[row], coords[candidates])[0]
+        if len(candidates) > neighbours:
+            closest = np.argpartition(distances, neighbours - 1)[:neighbours]
+        else:
+            closest = np.arange(len(candidates))
+        closest = closest[np.argsort(distances[closest], kind='stable')]
+        nearest[row, :len(closest)] = candidates[closest]
+        nearest_distances[row, :len(closest)] = distances[closest]
+    nearest_distances[nearest_distances > radius_km] = np.inf
+    in_range = np.isfinite(nearest_distances[:, 0])
+
+    if neighbours == 1:
+        result[in_range] = values[nearest[in_range, 0]]
+        return result
+
+    # An observation at the point itself wins outright
+    weights = np.where(np.isfinite(nearest_distances), 1.0 / np.maximum(nearest_distances, SAME_POINT_KM)**IDW_POWER, 0.0)
+    exact = nearest_distances[:, 0] <= SAME_POINT_KM
+    weights[exact, 1:] = 0.0
+    samples = values[nearest]
+    known = ~np.isnan(samples)
+    weighted = np.where(known, samples, 0.0) * weights[:, :, None]
+    total_weight = (weights[:, :, None] * known).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        blended = weighted.sum(axis=1) / total_weight
+    result[in_range] = blended[in_range]
+    return result
@@ -0,0 +1,81 @@
+weather_columns = [
+    "temperature_2m", "relative_humidity_2m", "precipitation", "rain", "snowfall", "cloud_cover",
+    "pressure_msl", "surface_pressure", "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m"
+]
+
+_column_ddl = ",\n    ".join(f"{column} REAL" for column in weather_columns)
+
+# Every observation ever collected, newest first per location
+CURRENT_WEATHER_DDL = f"""
+CREATE TABLE IF NOT EXISTS current_weather (
+    id SERIAL PRIMARY KEY,
+    time TIMESTAMP,
+    latitude REAL,
+    longitude REAL,
+    {_column_ddl}
+);
+CREATE INDEX IF NOT EXISTS current_weather_location_time_idx
+    ON current_weather (latitude, longitude, time DESC);
+"""
+
+# One row per location holding its newest observation. Locations are also
+# bucketed into 1 degree cells numbered row by row from the south-west
+# corner, so nearby observations can be found with one index probe.
+LATEST_WEATHER_DDL = f"""
+CREATE TABLE IF NOT EXISTS latest_weather (
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    time TIMESTAMP,
+    {_column_ddl},
+    grid_cell INTEGER GENERATED ALWAYS AS
+        ((floor(latitude)::int + 90) * 360 + ((floor(longitude)::int + 180) % 360)) STORED,
+    PRIMARY KEY (latitude, longitude)
+);
+CREATE INDEX IF NOT EXISTS latest_weather_grid_cell_idx ON latest_weather (grid_cell);
+"""
+
+# Keep latest_weather in step with every insert into current_weather,
+# whichever collector or loader made it. The trigger runs once per statement
+# over all inserted rows, so bulk loads pay for one upsert, not one per row.
+LATEST_WEATHER_TRIGGER_DDL = f"""
+CREATE OR REPLACE FUNCTION upsert_latest_weather() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO latest_weather (latitude, longitude, time, {', '.join(weather_columns)})
+    SELECT DISTINCT ON (latitude, longitude) latitude, longitude, time, {', '.join(weather_columns)}
+    FROM inserted_weather
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ORDER BY latitude, longitude, time DESC NULLS LAST
+    ON CONFLICT (latitude, longitude) DO UPDATE SET
+        time = EXCLUDED.time,
+        {', '.join(f'{column} = EXCLUDED.{column}' for column in weather_columns)}
+    WHERE latest_weather.time IS NULL OR EXCLUDED.time >= latest_weather.time;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS current_weather_latest ON current_weather;
+CREATE TRIGGER current_weather_latest
+    AFTER INSERT ON current_weather
+    REFERENCING NEW TABLE AS inserted_weather
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION upsert_latest_weather();
+"""
+
+# Seed latest_weather from existing history the first time it is created
+LATEST_WEATHER_BACKFILL = f"""
+INSERT INTO latest_weather (latitude, longitude, time, {', '.join(weather_columns)})
+SELECT DISTINCT ON (latitude, longitude) latitude, longitude, time, {', '.join(weather_columns)}
+FROM current_weather
+WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM latest_weather)
+ORDER BY latitude, longitude, time DESC NULLS LAST
+"""
+
+# Function to create the weather tables, indexes and trigger if missing
+def ensure_weather_schema(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(CURRENT_WEATHER_DDL)
+        cursor.execute(LATEST_WEATHER_DDL)
+        cursor.execute(LATEST_WEATHER_TRIGGER_DDL)
+        cursor.execute(LATEST_WEATHER_BACKFILL)
+    conn.commit()
@@ -1,95 +1,51 @@
 from flask import Flask, request, jsonify, send_from_directory
-import psycopg2
+import numpy as np
 import os
+import sys
 
-app = Flask(__name__)
+# Shared modules live in the project directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from weather_lookup import DEFAULT_RADIUS_KM, lookup_weather, weather_columns
+from metrics import instrument_app, span
+from profiling import instrument_profiling
+import risk_engine
 
-# Function to connect to the PostgreSQL database
-def connect_to_database():
-    conn = psycopg2.connect(
-        dbname="flight_navigation",
-        user="postgres",
-        password="password",
-        host="localhost",
-        port="5432"
-    )
-    return conn
-
-# Function to execute a query and fetch weather data based on latitude and longitude
-def get_weather_data(latitude, longitude):
-    conn = connect_to_database()
-    cursor = conn.cursor()
-
-    # Execute the query to fetch weather data based on latitude and longitude
-    query = """
-    SELECT temperature_2m, relative_humidity_2m, precipitation, rain, snowfall, cloud_cover, pressure_msl, 
-           surface_pressure, wind_speed_10m, wind_direction_10m, wind_gusts_10m 
-    FROM current_weather 
-    WHERE latitude = %s AND longitude = %s
-    """
-    cursor.execute(query, (latitude, longitude))
-    weather_data = cursor.fetchone()
-
-    conn.close()
-
-    if not weather_data:
+app = Flask(__name__)
+# Request latency histograms, with the stage spans below, served on /metrics
+instrument_app(app, 'riskass')
+# Opt-in per-request profiles, listed on /profiles
+instrument_profiling(app, 'riskass')
+
+# Largest number of coordinates accepted by the batch endpoint
+MAX_BATCH_POINTS = 1000
+
+# Function to fetch weather data for a latitude and longitude from the nearest
+# collected observation, or an inverse-distance blend of the nearest few
+def get_weather_data(latitude, longitude, radius_km=DEFAULT_RADIUS_KM, neighbours=1):
+    weather_values = lookup_weather([latitude], [longitude], radius_km, neighbours)[0]
+    if np.isnan(weather_values).all():
         return None
 
     # Convert the fetched data into a dictionary for easier processing
     weather_data_dict = {
-        "temperature_2m": weather_data[0],
-        "relative_humidity_2m": weather_data[1],
-        "precipitation": weather_data[2],
-        "rain": weather_data[3],
-        "snowfall": weather_data[4],
-        "cloud_cover": weather_data[5],
-        "pressure_msl": weather_data[6],
-        "surface_pressure": weather_data[7],
-        "wind_speed_10m": weather_data[8],
-        "wind_direction_10m": weather_data[9],
-        "wind_gusts_10m": weather_data[10]
+        param: None if np.isnan(value) else float(value)
+        for param, value in zip(weather_columns, weather_values)
     }
     #print(weather_data_dict)
     return weather_data_dict
 
-# Function to calculate risk assessment based on weather parameters and thresholds
-def calculate_risk_assessment(weather_data):
-    thresholds = {
-        "temperature_2m": {"low": 10, "medium": 20, "high": 30},
-        "relative_humidity_2m": {"low": 30, "medium": 60, "high": 90},
-        "precipitation": {"low": 0.1, "medium": 1, "high": 5},  # in mm/hr
-        "rain": {"low": 0.1, "medium": 1, "high": 5},  # in mm/hr
-        "snowfall": {"low": 1, "medium": 5, "high": 10},  # in mm/hr
-        "cloud_cover": {"low": 0.1, "medium": 0.5, "high": 0.8},
-        "pressure_msl": {"low": 980, "medium": 1000, "high": 1020},  # in hPa
-        "surface_pressure": {"low": 980, "medium": 1000, "high": 1020},  # in hPa
-        "wind_speed_10m": {"low": 5, "medium": 10, "high": 20},  # in m/s
-        "wind_direction_10m": {"low": 0, "medium": 180, "high": 360},  # in degrees
-        "wind_gusts_10m": {"low": 10, "medium": 20, "high": 30}  # in m/s
-    }
+# Function to fetch weather data for many coordinates with a single query.
+# Returns a (points, parameters) array with NaN rows where nothing is in range.
+def get_weather_data_batch(latitudes, longitudes, radius_km=DEFAULT_RADIUS_KM, neighbours=1):
+    return lookup_weather(latitudes, longitudes, radius_km, neighbours)
+
+# Function to read the lookup options of a request body. Raises ValueError
+# or TypeError when they are not numbers.
+def lookup_options(data):
+    return float(data.get('radius_km', DEFAULT_RADIUS_KM)), int(data.get('neighbours', 1))
 
-    risk_assessment = 0
-    for param, value in weather_data.items():
-        if value < thresholds[param]["low"]:
-            risk_assessment += 1
-        elif value < thresholds[param]["medium"]:
-            risk_assessment += 2
-        else:
-            risk_assessment += 3
-
-    return risk_assessment
-
-# Function to assign risk level based on risk assessment score
-def assign_risk_level(risk_assessment):
-    low_threshold = 20  # Example threshold values, adjust according to your requirements
-    medium_threshold = 40
-
-    if risk_assessment < low_threshold:
-        return "Low"
-    elif risk_assessment < medium_threshold:
-        return "Medium"
-    else:
-        return "High"
+def valid_coordinates(latitudes, longitudes):
+    return bool(np.all((np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180)))
 
 @app.route('/')
 def index():
@@ -97,19 +53,70 @@ def index():
 
 @app.route('/risk_assessment', methods=['POST'])
 def get_risk_assessment():
-    data = request.get_json()
-    latitude = data['latitude']
-    longitude = data['longitude']
-
-    weather_data = get_weather_data(latitude, longitude)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+        radius_km, neighbours = lookup_options(data)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "latitude and longitude are required, and every field must be a number"}), 400
+    if not valid_coordinates(latitude, longitude):
+        return jsonify({"error": "latitude must be within 90 and longitude within 180 degrees"}), 400
+
+    weather_data = get_weather_data(latitude, longitude, radius_km, neighbours)
     if weather_data is None:
         return jsonify({"error": "No weather data found for the provided latitude and longitude"}), 404
 
-    risk_assessment = calculate_risk_assessment(weather_data)
-    risk_level = assign_risk_level(risk_assessment)
+    with span('risk_scoring'):
+        risk_assessment = risk_engine.score(weather_data)
+        risk_level = risk_engine.risk_level(risk_assessment)
 
     return jsonify({"risk_level": risk_level, "weather_data": weather_data})
 
 
+@app.route('/risk_assessment/batch', methods=['POST'])
+def get_risk_assessment_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    points = data.get('points', [])
+    if not points or not isinstance(points, list):
+        return jsonify({"error": "No points provided"}), 400
+    if len(points) > MAX_BATCH_POINTS:
+        return jsonify({"error": f"At most {MAX_BATCH_POINTS} points are accepted per request"}), 400
+
+    try:
+        coordinates = np.array(points, dtype=np.float64)
+        radius_km, neighbours = lookup_options(data)
+    except (TypeError, ValueError):
+        coordinates = None
+    if coordinates is None or coordinates.ndim != 2 or coordinates.shape[1] != 2:
+        return jsonify({"error": "points must be [latitude, longitude] pairs and every field a number"}), 400
+    if not valid_coordinates(coordinates[:, 0], coordinates[:, 1]):
+        return jsonify({"error": "latitude must be within 90 and longitude within 180 degrees"}), 400
+    weather_values = get_weather_data_batch(coordinates[:, 0], coordinates[:, 1], radius_km, neighbours)
+    found = ~np.isnan(weather_values).all(axis=1)
+
+    with span('risk_scoring'):
+        risk_assessment = risk_engine.score_batch(weather_values, weather_columns)
+        risk_level = risk_engine.risk_level_batch(risk_assessment)
+
+    # One list per field, with null for points that have no weather data and
+    # for values that are missing, since JSON has no NaN
+    def column(values):
+        return [value if ok and value == value else None for value, ok in zip(values.tolist(), found.tolist())]
+
+    return jsonify({
+        "latitude": coordinates[:, 0].tolist(),
+        "longitude": coordinates[:, 1].tolist(),
+        "found": found.tolist(),
+        "risk_assessment": column(risk_assessment),
+        "risk_level": column(risk_level),
+        "weather_data": {param: column(weather_values[:, i]) for i, param in enumerate(weather_columns)}
+    })
+
+
 if __name__ == '__main__':
     app.run(debug=True)